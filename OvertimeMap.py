@@ -9,6 +9,7 @@ import matplotlib.dates as mdates
 from calplot import calplot
 from datetime import timedelta
 from utils.theme import get_theme
+from utils.dashboard_data import get_dashboard_data, date_slice
 
 # Apply theme settings
 theme = get_theme()
@@ -19,12 +20,6 @@ def overtime_map_body():
     DEFAULT_LOCATION = [38.456085, -92.288368]  # Center of continental US
     DEFAULT_ZOOM = 4
 
-    # --- Load data ---
-    df = pd.read_csv("Outputs/DashBoardData.zip", parse_dates=["Date"])
-
-    # Rename latitude and longitude columns
-    df.rename(columns={"StationLatitude": "WS_Latitude", "StationLongitude": "WS_Longitude"}, inplace=True)
-
     # --- Weather indicators ---
     weather_vars = [
         "WT16", "WT01", "WT04", "WT18", "WT22", "WT09", "WT11", "WT06", "WT08", "WT05", 
@@ -54,12 +49,20 @@ def overtime_map_body():
 
     display_level = st.selectbox("Display Level", ["City", "State"], index=0)
 
+    # --- Load data (shared, read-only dataset cached once per process) ---
+    df = get_dashboard_data()
+
     if "date_choice" not in st.session_state:
-        st.session_state.date_choice = df["Date"].min()
+        st.session_state.date_choice = df["Date"].iloc[0]  # rows are date-sorted
     date_choice = st.session_state.date_choice
 
-    # --- Filter Data ---
-    filtered_df = df[df["Date"] == pd.to_datetime(date_choice)]
+    # --- Filter Data (binary search on the sorted Date column) ---
+    filtered_df = date_slice(df, date_choice)[
+        ["Date", "City", "State", "StationLatitude", "StationLongitude"] + weather_vars
+    ]
+
+    # Rename latitude and longitude columns
+    filtered_df = filtered_df.rename(columns={"StationLatitude": "WS_Latitude", "StationLongitude": "WS_Longitude"})
 
     if display_level == "City":
         group_cols = ["City", "State", "WS_Latitude", "WS_Longitude"]
@@ -72,7 +75,7 @@ def overtime_map_body():
     agg_dict = {col: "max" for col in binary_vars}
     agg_dict.update({col: "mean" for col in numeric_vars})
 
-    grouped = filtered_df.groupby(group_cols).agg(agg_dict).reset_index()
+    grouped = filtered_df.groupby(group_cols, observed=True).agg(agg_dict).reset_index()
 
     # --- State centroids ---
     state_centroids = {
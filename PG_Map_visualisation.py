@@ -7,13 +7,16 @@ import json
 import requests
 import numpy as np
 from utils.theme import get_theme
+from utils.dashboard_data import get_dashboard_data, get_map_cube, lookup_map_cube
 
 theme = get_theme()
 
 
 def map_visualisation_body():
-    # Load data from ZIP using pandas (single file in zip assumption)
-    df = pd.read_csv("Outputs/DashBoardData.zip", parse_dates=["Date"])
+    # Shared, read-only dataset (sorted by Date) and pre-aggregated map cube
+    dates = get_dashboard_data()["Date"]
+    cube = get_map_cube()
+    years = sorted((period.year for period in cube[("Year", "State")][1]), reverse=True)
 
     # Streamlit UI
     st.title("Air Quality Map with Filters")
@@ -26,23 +29,23 @@ def map_visualisation_body():
 
         with col2:
             if mode == "Day":
-                selected_date = st.date_input("Select Date", df["Date"].min())
+                selected_date = st.date_input("Select Date", dates.iloc[0])
             elif mode == "Week":
                 cola, colb = st.columns(2)
                 with cola:
-                    year = st.selectbox("Year", sorted(df["Date"].dt.year.unique(), reverse=True), key="week_year")
+                    year = st.selectbox("Year", years, key="week_year")
                 with colb:
                     week = st.selectbox("Week", list(range(1, 54)))
                 selected_date = pd.to_datetime(f"{year}-W{week}-1", format="%G-W%V-%u")
             elif mode == "Month":
                 cola, colb = st.columns(2)
                 with cola:
-                    year = st.selectbox("Year", sorted(df["Date"].dt.year.unique(), reverse=True), key="month_year")
+                    year = st.selectbox("Year", years, key="month_year")
                 with colb:
                     month = st.selectbox("Month", list(range(1, 13)))
                 selected_date = pd.to_datetime(f"{year}-{month:02d}-01")
             else:
-                selected_date = st.date_input("Select Date", df["Date"].min(), key="season_date")
+                selected_date = st.date_input("Select Date", dates.iloc[0], key="season_date")
 
         with col3:
             measure = st.selectbox("AQI Measure", ["NO2", "CO", "SO2", "O3"])
@@ -64,45 +67,10 @@ def map_visualisation_body():
 
     # Convert to datetime
     selected_date = pd.to_datetime(selected_date)
-
-    # Add Season column
-    df['Season'] = df['Date'].dt.month % 12 // 3 + 1
-    season_map = {1: 'Winter', 2: 'Spring', 3: 'Summer', 4: 'Autumn'}
-    df['SeasonGroup'] = df['Season'].map(season_map)
-
-    # Rename latitude and longitude columns
-    df.rename(columns={"StationLatitude": "WS_Latitude", "StationLongitude": "WS_Longitude"}, inplace=True)
-
-    # Define aggregation level
-    agg_level = {
-        "City": ["City", "State", "WS_Latitude", "WS_Longitude"],
-        "State": ["State"]
-    }[display_level]
-
     weather_cols = list(weather_icons.keys())
-    agg_dict = {f"{measure}_AQI_Group": "mean"}
-    agg_dict.update({col: "max" for col in weather_cols})
-
-    # Filter and aggregate by selected mode
-    if mode == "Day":
-        df_filtered = df[df["Date"] == selected_date]
-    elif mode == "Week":
-        week = selected_date.isocalendar().week
-        year = selected_date.year
-        df_filtered = df[df["Date"].dt.isocalendar().week == week]
-        df_filtered = df_filtered[df_filtered["Date"].dt.year == year]
-    elif mode == "Month":
-        df_filtered = df[(df["Date"].dt.month == selected_date.month) & (df["Date"].dt.year == selected_date.year)]
-    elif mode == "Quarter":
-        quarter = (selected_date.month - 1) // 3 + 1
-        df_filtered = df[df["Date"].dt.to_period("Q") == f"{selected_date.year}Q{quarter}"]
-    elif mode == "Year":
-        df_filtered = df[df["Date"].dt.year == selected_date.year]
-    else:
-        df_filtered = df[df["SeasonGroup"] == df[df["Date"] == selected_date]["SeasonGroup"].iloc[0]]
 
-    if not df_filtered.empty:
-        df_filtered = df_filtered.groupby(agg_level).agg(agg_dict).reset_index()
+    # Look up the pre-aggregated period instead of grouping the raw rows
+    df_filtered = lookup_map_cube(cube, mode, display_level, selected_date)
 
     # Create map
     m = folium.Map(location=[39.8283, -98.5795], zoom_start=4)
@@ -116,7 +84,7 @@ def map_visualisation_body():
     # Load geojson for US states
     geo_url = "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json"
     geojson_data = requests.get(geo_url).json()
-    df_filtered["Region"] = df_filtered["State"]
+    df_filtered = df_filtered.assign(Region=df_filtered["State"])
 
     # Choropleth
     if display_level == "State":
@@ -157,8 +125,7 @@ def map_visualisation_body():
 
     # Weather icons
     if show_weather:
-        city_weather = df[df["Date"].dt.to_period(mode[0]) == selected_date.to_period(mode[0])]
-        city_weather = city_weather.groupby(["City", "State", "WS_Latitude", "WS_Longitude"])[weather_cols].max().reset_index()
+        city_weather = lookup_map_cube(cube, mode, "City", selected_date)
         for _, row in city_weather.iterrows():
             lat, lon = row["WS_Latitude"], row["WS_Longitude"]
             if pd.isna(lat) or pd.isna(lon):
@@ -7,6 +7,7 @@ import scipy.stats as stats
 import numpy as np
 import os
 from utils.theme import get_theme
+from utils.dashboard_data import DASHBOARD_ZIP, get_dashboard_data
 
 theme = get_theme()
 
@@ -38,17 +39,13 @@ def pollution_weather_analysis():
         - `*` = p < 0.05 (statistically significant)
         """)
 
-        # ✅ Correct CSV File Path  
-        CSV_PATH = r"Outputs//DashBoardData.zip"
-
-        @st.cache_data
         def load_data():
-            """Loads AQI and Weather Data from CSV."""
-            if not os.path.exists(CSV_PATH):
-                st.error(f"File not found: {CSV_PATH}")
+            """Returns the shared AQI and Weather dataset."""
+            if not os.path.exists(DASHBOARD_ZIP):
+                st.error(f"File not found: {DASHBOARD_ZIP}")
                 return None
             try:
-                df = pd.read_csv(CSV_PATH, parse_dates=["Date"])
+                df = get_dashboard_data()
                 return df
             except Exception as e:
                 st.error(f"Error loading data: {e}")
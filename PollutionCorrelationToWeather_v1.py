@@ -3,16 +3,15 @@ import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 from utils.theme import get_theme
+from utils.dashboard_data import get_dashboard_data
 
 theme = get_theme()
 
 def correllation_body2():
     st.title("🌍 AQI vs Weather Conditions: More Correlation Overview")
-    @st.cache_data
-    def load_data():
-        return pd.read_csv("Outputs//DashBoardData.zip", parse_dates=["Date"])
-
-    df = load_data()
+    # Shallow copy of the shared dataset: the bar charts add a WeatherBin
+    # column, which must not leak into the cached frame
+    df = get_dashboard_data().copy(deep=False)
 
     # Column Definitions
     aqi_info = [
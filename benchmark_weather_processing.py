@@ -0,0 +1,86 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from weather_processor import aggregate_weather, load_element_config
+
+# Benchmarks the single-pass aggregation engine against the per-aggfunc
+# pivot_table chain it replaced, on synthetic GHCN-Daily rows.
+# Run: python benchmark_weather_processing.py --rows 5000000
+
+
+def pivot_chain_aggregate(weather_df, element_agg_map):
+    """The original process_weather_files aggregation: one masked
+    pivot_table per aggregation type, then a column-wise concat."""
+    weather_df = weather_df.assign(AggType=weather_df["Element"].map(element_agg_map))
+    pivoted_dfs = []
+
+    for agg_func in ["mean", "max", "min"]:
+        sub_df = weather_df[weather_df["AggType"] == agg_func]
+        if not sub_df.empty:
+            pivot = sub_df.pivot_table(
+                index=["Station_ID", "Date"],
+                columns="Element",
+                values="DataValue",
+                aggfunc=agg_func
+            )
+            pivoted_dfs.append(pivot)
+
+    return pd.concat(pivoted_dfs, axis=1).reset_index()
+
+
+def make_weather_rows(n_rows, element_agg_map, n_stations=2000, seed=42):
+    """Synthetic rows shaped like a filtered GHCN-Daily year."""
+    rng = np.random.default_rng(seed)
+    stations = np.array([f"US{i:09d}" for i in range(n_stations)])
+    dates = pd.date_range("2010-01-01", "2010-12-31").strftime("%Y%m%d").astype(int).to_numpy()
+    elements = np.array(list(element_agg_map))
+    return pd.DataFrame({
+        "Station_ID": stations[rng.integers(0, len(stations), n_rows)],
+        "Date": dates[rng.integers(0, len(dates), n_rows)],
+        "Element": elements[rng.integers(0, len(elements), n_rows)],
+        "DataValue": rng.integers(-300, 400, n_rows),
+    })
+
+
+def best_of(func, repeats):
+    """Best wall time of repeats calls, and the last result."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the weather aggregation engine")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--config", default="config/element_config.json")
+    args = parser.parse_args()
+
+    element_agg_map = load_element_config(args.config)
+    weather_df = make_weather_rows(args.rows, element_agg_map)
+    print(f"{len(weather_df):,} rows, {len(element_agg_map)} elements")
+
+    pivot_time, expected = best_of(
+        lambda: pivot_chain_aggregate(weather_df, element_agg_map), args.repeats)
+    engine_time, result = best_of(
+        lambda: aggregate_weather(weather_df, element_agg_map), args.repeats)
+
+    # Same rows, columns and values as the pivot chain (whose row order
+    # depends on how concat unions the pivots' indexes)
+    keys = ["Station_ID", "Date"]
+    pd.testing.assert_frame_equal(
+        result.sort_values(keys, ignore_index=True),
+        expected.sort_values(keys, ignore_index=True),
+        check_dtype=False, check_names=False, check_exact=False)
+
+    print(f"pivot_table chain : {pivot_time:8.2f}s")
+    print(f"single-pass engine: {engine_time:8.2f}s")
+    print(f"speed-up          : {pivot_time / engine_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
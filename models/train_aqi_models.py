@@ -1,14 +1,20 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import PowerTransformer
 import joblib
 
+# Run as `python models/train_aqi_models.py` from the repo root: make the
+# repo root importable so the utils package is found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.dashboard_data import load_dashboard_data  # noqa: E402
+
 # === Load your main dataset ===
-df = pd.read_csv("Outputs/DashBoardData.zip", low_memory=False)
+df = load_dashboard_data()
 
 # === Parse and engineer date features ===
 df["Date"] = pd.to_datetime(df["Date"])
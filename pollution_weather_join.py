@@ -0,0 +1,459 @@
+import os
+import shutil
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from typing import Optional
+from utils.dashboard_data import PARTITIONING
+from utils.Zip_To_Parquet import infer_unified_schema, _read_dtypes
+from utils.geo_utils import haversine_knn
+
+# Joins pollution sites to the daily weather of their closest station out
+# of core: pollution is staged into Year partitions, then each year is
+# joined against the matching weather partition (Us_Weather_Parquet/Year=YYYY
+# from process_weather_files(output_format="parquet")) with a sort-merge on
+# (StationId, Date) and appended to a Year/State store. Peak memory is one
+# year of pollution plus the weather rows of its stations.
+#
+# Closest-station run:
+#   1. python run_processing.py            ingest the sites' ClosestStation
+#   2. python pollution_weather_join.py    stage pollution and join
+# Inverse distance weighted (IDW) run, which needs the weather of every
+# neighbouring station, not just the closest one:
+#   1. python pollution_weather_join.py --idw-stations
+#      writes IDW_WEIGHTS_FILE and IDW_STATIONS_FILE (the union of the
+#      closest and neighbouring stations)
+#   2. python run_processing.py --idw      ingest the IDW_STATIONS_FILE stations
+#   3. python pollution_weather_join.py --idw
+
+POLLUTION_ZIP = os.path.join("Source_Data", "pollution_us_2000_2016.csv.zip")
+STATIONS_FILE = os.path.join("Source_Data", "Us_City_with_Station.csv")
+WEATHER_STORE = os.path.join("Not_to_be_shared_to_repo", "Us_Weather_Parquet")
+POLLUTION_STAGING = os.path.join("Not_to_be_shared_to_repo", "Pollution_parquet")
+JOINED_STORE = os.path.join("Outputs", "PollutionWeather_parquet")
+GHCN_STATIONS = os.path.join("Source_Data", "ghcnd-stations.txt")
+
+YEAR_PARTITIONING = ds.partitioning(pa.schema([("Year", pa.int64())]), flavor="hive")
+JOIN_KEYS = ["StationId", "Date"]
+# Inverse distance weighting: stations per site, search radius, distance
+# power, and a floor so a station on top of a site doesn't get infinite weight
+IDW_NEIGHBOURS = 4
+IDW_RADIUS_KM = 50
+IDW_POWER = 2
+IDW_MIN_DISTANCE_KM = 0.1
+# Site/station weights and the station list weather ingestion needs for them
+IDW_WEIGHTS_FILE = os.path.join("Not_to_be_shared_to_repo", "IDW_weights.csv")
+IDW_STATIONS_FILE = os.path.join("Not_to_be_shared_to_repo", "IDW_stations.csv")
+# Per-row station columns; in IDW mode they describe the nearest station used
+NEAREST_STATION_COLUMNS = ["StationId", "StationDistance", "StationLatitude", "StationLongitude"]
+
+
+def _staged_schema(pollution_schema: pa.Schema, stations: pd.DataFrame) -> pa.Schema:
+    """Schema of the staged rows: the pollution columns (Date Local becomes
+    a date32 Date), the station columns they gain and the Year."""
+    station_schema = pa.Schema.from_pandas(stations, preserve_index=False)
+    fields = [f for f in pollution_schema if f.name != "Date Local"]
+    fields += [pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+               for f in station_schema]
+    return pa.schema(fields + [("Date", pa.date32()), ("Year", pa.int64())])
+
+
+def stage_pollution(
+    pollution_path: str = POLLUTION_ZIP,
+    stations_file: str = STATIONS_FILE,
+    staging_dir: str = POLLUTION_STAGING,
+    chunksize: int = 500_000,
+    schema: Optional[pa.Schema] = None
+) -> str:
+    """
+    Streams the pollution CSV in chunks, attaches each site's closest
+    weather station (matched on Address, as in the notebooks) and writes
+    the rows to a Parquet dataset partitioned by Year.
+
+    Args:
+        pollution_path: Zip holding the pollution CSV.
+        stations_file: Site to closest station table.
+        staging_dir: Directory of the Year-partitioned output.
+        chunksize: Rows read per chunk.
+        schema: Schema of the pollution CSV. Inferred over the whole file
+            with infer_unified_schema when None, so columns that are empty
+            or integer in early chunks and float later are typed correctly.
+
+    Returns:
+        The staging directory.
+    """
+    if schema is None:
+        schema = infer_unified_schema(pollution_path, chunksize)
+    schema = pa.schema([f for f in schema if f.name != "Unnamed: 0"])
+    stations = pd.read_csv(stations_file)
+    stations["StationId"] = stations["ClosestStation"].str.upper()
+    # Only bring in station columns the pollution rows don't already carry
+    station_cols = ["Address"] + [c for c in stations.columns if c not in schema.names]
+    stations = stations[station_cols]
+    staged_schema = _staged_schema(schema, stations.drop(columns="Address"))
+
+    tmp_dir = f"{staging_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    rows_read = rows_kept = 0
+    for i, chunk in enumerate(pd.read_csv(pollution_path, chunksize=chunksize,
+                                          dtype=_read_dtypes(schema), low_memory=False)):
+        rows_read += len(chunk)
+        chunk = chunk.drop(columns=["Unnamed: 0"], errors="ignore")
+        chunk = chunk.merge(stations, on="Address", how="inner")
+        chunk["Date"] = pd.to_datetime(chunk.pop("Date Local")).dt.date
+        chunk["Year"] = pd.to_datetime(chunk["Date"]).dt.year
+        rows_kept += len(chunk)
+
+        # Every chunk is written with the schema of the whole file
+        table = pa.Table.from_pandas(chunk, schema=staged_schema, preserve_index=False)
+        ds.write_dataset(
+            table,
+            tmp_dir,
+            format="parquet",
+            partitioning=YEAR_PARTITIONING,
+            basename_template=f"chunk-{i}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.replace(tmp_dir, staging_dir)
+    logging.info(f"Staged {rows_kept} of {rows_read} pollution rows to {staging_dir}")
+    return staging_dir
+
+
+def load_ghcn_stations(path: str = GHCN_STATIONS) -> pd.DataFrame:
+    """US stations from the fixed width ghcnd-stations.txt, with
+    StationId, Latitude and Longitude."""
+    stations = pd.read_fwf(path, widths=[11, 9, 10, 7, 3, 31, 4, 4, 5], header=None,
+                           usecols=[0, 1, 2], names=["StationId", "Latitude", "Longitude"])
+    return stations[stations["StationId"].str[:2] == "US"].reset_index(drop=True)
+
+
+def station_weights(
+    sites: pd.DataFrame,
+    stations: pd.DataFrame,
+    k: int = IDW_NEIGHBOURS,
+    radius_km: float = IDW_RADIUS_KM,
+    power: float = IDW_POWER,
+    site_key: str = "Address",
+    site_lat_col: str = "latitude",
+    site_lon_col: str = "longitude"
+) -> pd.DataFrame:
+    """
+    Finds the k nearest stations within radius_km of every site with one
+    KD-tree query and gives each an inverse distance weight 1 / d**power.
+    Weights are renormalized at join time over the stations that actually
+    report a value, so they are left unnormalized here.
+
+    Args:
+        sites: One row per pollution site (e.g. Us_City_with_Station.csv).
+        stations: StationId, Latitude, Longitude (see load_ghcn_stations).
+        k, radius_km, power: IDW neighbours, search radius and power.
+        site_key: Column identifying a site in the pollution rows.
+        site_lat_col, site_lon_col: Site coordinate columns.
+
+    Returns:
+        DataFrame: site_key, StationId, StationDistance (km),
+        StationLatitude, StationLongitude and Weight, one row per site and
+        station in range.
+    """
+    sites = sites.drop_duplicates(site_key)
+    distances, indices = haversine_knn(
+        sites[site_lat_col].to_numpy(), sites[site_lon_col].to_numpy(),
+        stations["Latitude"].to_numpy(), stations["Longitude"].to_numpy(),
+        k=k, radius_km=radius_km
+    )
+    in_range = indices >= 0
+    site_rows = np.nonzero(in_range)[0]
+    distance = distances[in_range]
+    weights = pd.DataFrame({
+        site_key: sites[site_key].to_numpy()[site_rows],
+        "StationId": stations["StationId"].to_numpy()[indices[in_range]],
+        "StationDistance": distance,
+        "StationLatitude": stations["Latitude"].to_numpy()[indices[in_range]],
+        "StationLongitude": stations["Longitude"].to_numpy()[indices[in_range]],
+        "Weight": 1 / np.maximum(distance, IDW_MIN_DISTANCE_KM) ** power,
+    })
+    logging.info(f"{weights[site_key].nunique()} of {len(sites)} sites have a station "
+                 f"within {radius_km} km ({len(weights)} site-station pairs)")
+    return weights
+
+
+def write_idw_stations(
+    sites_file: str = STATIONS_FILE,
+    ghcn_stations_file: str = GHCN_STATIONS,
+    weights_file: str = IDW_WEIGHTS_FILE,
+    stations_file: str = IDW_STATIONS_FILE,
+    **weight_options
+) -> pd.DataFrame:
+    """
+    Computes the IDW station weights of every site and writes them, plus
+    the station list weather ingestion must keep for them: every station
+    any site blends, and every site's ClosestStation so the closest-station
+    join keeps working from the same weather store. Run it before
+    process_weather_files, passing stations_file with
+    station_fieldname="StationId".
+
+    Args:
+        sites_file: Sites with coordinates and ClosestStation.
+        ghcn_stations_file: ghcnd-stations.txt.
+        weights_file: CSV the weights are written to.
+        stations_file: CSV of StationId the ingestion station list is
+            written to.
+        weight_options: Passed to station_weights (k, radius_km, ...).
+
+    Returns:
+        The weights.
+    """
+    sites = pd.read_csv(sites_file)
+    weights = station_weights(sites, load_ghcn_stations(ghcn_stations_file), **weight_options)
+    station_ids = pd.concat([weights["StationId"],
+                             sites["ClosestStation"].dropna().str.upper()])
+    for path in (weights_file, stations_file):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    weights.to_csv(weights_file, index=False)
+    pd.DataFrame({"StationId": np.sort(station_ids.unique())}).to_csv(stations_file, index=False)
+    logging.info(f"Wrote weights to {weights_file} and {station_ids.nunique()} "
+                 f"stations to ingest to {stations_file}")
+    return weights
+
+
+def _partition_years(store_dir: str) -> set:
+    return {
+        int(name.split("=", 1)[1])
+        for name in os.listdir(store_dir)
+        if name.startswith("Year=")
+    }
+
+
+def _join_keys(table: pa.Table, station_categories: pa.Array) -> np.ndarray:
+    """(StationId, Date) packed into one int64: the station's position in
+    the shared sorted station list, then days since the epoch."""
+    stations = pc.index_in(table["StationId"].cast(pa.string()), value_set=station_categories)
+    days = table["Date"].cast(pa.date32()).cast(pa.int32())
+    return (stations.to_numpy().astype(np.int64) << 32) | days.to_numpy().astype(np.int64)
+
+
+def _merge_join_indices(left_keys: np.ndarray, right_keys: np.ndarray):
+    """Inner-join row indices of two sorted key arrays, many-to-many. Each
+    left key's run of equal right keys is found by binary search, so the
+    join never builds a hash table."""
+    lo = np.searchsorted(right_keys, left_keys, side="left")
+    hi = np.searchsorted(right_keys, left_keys, side="right")
+    counts = hi - lo
+    left_idx = np.repeat(np.arange(len(left_keys)), counts)
+    run_start = np.repeat(np.cumsum(counts) - counts, counts)
+    right_idx = np.repeat(lo, counts) + (np.arange(counts.sum()) - run_start)
+    return left_idx, right_idx
+
+
+def _join_year(pollution: pa.Table, weather: pa.Table) -> pa.Table:
+    """Sort-merge joins one year of pollution to weather on (StationId, Date)."""
+    station_categories = pc.unique(pa.concat_arrays([
+        pollution["StationId"].cast(pa.string()).combine_chunks(),
+        weather["StationId"].cast(pa.string()).combine_chunks(),
+    ])).sort()
+
+    left_keys = _join_keys(pollution, station_categories)
+    right_keys = _join_keys(weather, station_categories)
+    left_order = np.argsort(left_keys, kind="stable")
+    right_order = np.argsort(right_keys, kind="stable")  # weather is written sorted: near free
+    left_idx, right_idx = _merge_join_indices(left_keys[left_order], right_keys[right_order])
+
+    joined = pollution.take(pa.array(left_order[left_idx]))
+    weather_rows = weather.take(pa.array(right_order[right_idx]))
+    for name in weather.column_names:
+        if name not in JOIN_KEYS:
+            joined = joined.append_column(name, weather_rows[name])
+    return joined
+
+
+def _idw_join_year(pollution: pa.Table, weather: pa.Table, weights: pd.DataFrame,
+                   site_key: str = "Address") -> pa.Table:
+    """
+    Blends the weather of each pollution row's weighted stations. Every
+    (row, station) pair is looked up in the sorted weather keys, then each
+    element is sum(w * value) / sum(w) over the stations reporting it, for
+    all rows at once with np.bincount. Rows with no reporting station are
+    dropped, as in the closest-station inner join. 0/1 flags (WTxx)
+    become the weighted share of stations reporting them.
+
+    The staged closest-station columns (StationId, StationDistance,
+    StationLatitude, StationLongitude) are replaced by the nearest station
+    that reported for the row, so they describe a station the blend
+    actually uses.
+    """
+    # Expand each pollution row to its (station, weight) pairs
+    rows = pd.DataFrame({site_key: pollution[site_key].to_pandas(),
+                         "row": np.arange(pollution.num_rows)})
+    pairs = rows.merge(weights[[site_key] + NEAREST_STATION_COLUMNS + ["Weight"]], on=site_key)
+    pair_stations = pairs[NEAREST_STATION_COLUMNS]
+    pairs = pa.table({
+        "StationId": pa.array(pairs["StationId"], type=pa.string()),
+        "Date": pollution["Date"].take(pa.array(pairs["row"].to_numpy())),
+        "row": pa.array(pairs["row"].to_numpy()),
+        "Weight": pa.array(pairs["Weight"].to_numpy()),
+    })
+
+    station_categories = pc.unique(pa.concat_arrays([
+        pairs["StationId"].combine_chunks(),
+        weather["StationId"].cast(pa.string()).combine_chunks(),
+    ])).sort()
+    pair_keys = _join_keys(pairs, station_categories)
+    weather_keys = _join_keys(weather, station_categories)
+    weather_order = np.argsort(weather_keys, kind="stable")
+    weather_keys = weather_keys[weather_order]
+
+    # (StationId, Date) is unique in the weather, so one probe per pair
+    position = np.searchsorted(weather_keys, pair_keys)
+    hit = position < len(weather_keys)
+    hit[hit] = weather_keys[position[hit]] == pair_keys[hit]
+    pair_rows = pairs["row"].to_numpy()[hit]
+    pair_weights = pairs["Weight"].to_numpy()[hit]
+    weather_rows = weather_order[position[hit]]
+
+    n_rows = pollution.num_rows
+    reporting = np.bincount(pair_rows, minlength=n_rows)
+    keep = reporting > 0
+    joined = pollution.filter(pa.array(keep))
+
+    # Nearest reporting station of each kept row: sort the hits by row,
+    # then distance, and take the first of each row's run (rows ascend,
+    # matching the order of the kept rows)
+    pair_stations = pair_stations[hit]
+    order = np.lexsort((pair_stations["StationDistance"].to_numpy(), pair_rows))
+    first = order[np.r_[True, pair_rows[order][1:] != pair_rows[order][:-1]]] if len(order) else order
+    nearest = pair_stations.iloc[first]
+    for name in NEAREST_STATION_COLUMNS:
+        column = pa.array(nearest[name].to_numpy())
+        if name in joined.column_names:
+            index = joined.column_names.index(name)
+            joined = joined.set_column(index, name, column.cast(joined.schema.field(name).type))
+        else:
+            joined = joined.append_column(name, column)
+    for name in weather.column_names:
+        if name in JOIN_KEYS:
+            continue
+        values = weather[name].to_numpy()[weather_rows].astype(np.float64)
+        present = ~np.isnan(values)
+        weighted = np.bincount(pair_rows, weights=np.where(present, pair_weights * values, 0),
+                               minlength=n_rows)
+        total = np.bincount(pair_rows, weights=np.where(present, pair_weights, 0),
+                            minlength=n_rows)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            blended = weighted / total
+        joined = joined.append_column(name, pa.array(blended[keep]))
+    return joined.append_column("IDWStationCount", pa.array(reporting[keep]))
+
+
+def join_pollution_weather(
+    pollution_dir: str = POLLUTION_STAGING,
+    weather_dir: str = WEATHER_STORE,
+    output_dir: str = JOINED_STORE,
+    years: Optional[list] = None,
+    weights: Optional[pd.DataFrame] = None,
+    site_key: str = "Address"
+) -> str:
+    """
+    Joins staged pollution to daily weather one year at a time and streams
+    each joined year into a Parquet store partitioned like the dashboard
+    store (Year, State), so it can be read with load_dashboard_data.
+
+    Only the weather rows of stations present in that year's pollution are
+    read, using filter pushdown on the weather partition.
+
+    By default each site takes the weather of its closest station. With
+    weights (from station_weights) each row instead gets an inverse
+    distance weighted blend of its k nearest stations within the radius,
+    so sites are not tied to a single, possibly distant, station. The
+    StationId, StationDistance and Station coordinates of a blended row are
+    those of the nearest station it uses, and IDWStationCount says how many
+    stations it blends:
+
+        weights = write_idw_stations()
+        # ... process_weather_files(stations_file=IDW_STATIONS_FILE,
+        #                           station_fieldname="StationId", ...)
+        join_pollution_weather(weights=weights)
+
+    The weather store must hold every station in the weights (see
+    write_idw_stations); stations missing from it are simply left out of
+    the blend.
+
+    Args:
+        pollution_dir: Year-partitioned pollution from stage_pollution.
+        weather_dir: Year-partitioned weather from process_weather_files.
+        output_dir: Directory of the joined store.
+        years: Years to join (default: every year present in both inputs).
+        weights: Optional site/station IDW weights from station_weights.
+        site_key: Column identifying a site in the pollution rows and the
+            weights (as passed to station_weights).
+
+    Returns:
+        The output directory.
+    """
+    available = _partition_years(pollution_dir) & _partition_years(weather_dir)
+    years = sorted(available if years is None else available & set(years))
+
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    total = 0
+    for year in years:
+        pollution = ds.dataset(os.path.join(pollution_dir, f"Year={year}"),
+                               format="parquet").to_table()
+        pollution = pollution.append_column("Year", pa.array(np.full(pollution.num_rows, year)))
+        if weights is None:
+            station_ids = pc.unique(pollution["StationId"].cast(pa.string()))
+        else:
+            sites = pc.unique(pollution[site_key]).to_pylist()
+            station_ids = pa.array(
+                weights.loc[weights[site_key].isin(sites), "StationId"].unique(),
+                type=pa.string())
+
+        weather = ds.dataset(os.path.join(weather_dir, f"Year={year}"), format="parquet")
+        # No cast: row groups are only pruned on the plain string Station_ID
+        weather = weather.to_table(filter=pc.field("Station_ID").isin(station_ids))
+        weather = weather.rename_columns(
+            ["StationId" if name == "Station_ID" else name for name in weather.column_names])
+
+        if weights is None:
+            joined = _join_year(pollution, weather)
+        else:
+            joined = _idw_join_year(pollution, weather, weights, site_key)
+        total += joined.num_rows
+        logging.info(f"{year}: {pollution.num_rows} pollution rows x "
+                     f"{weather.num_rows} weather rows -> {joined.num_rows} joined")
+        ds.write_dataset(
+            joined,
+            tmp_dir,
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=f"part-{year}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+
+    if years:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+    logging.info(f"Joined {total} rows for {len(years)} years into {output_dir}")
+    return output_dir
+
+
+if __name__ == "__main__":
+    # Step order is described at the top of this module
+    parser = argparse.ArgumentParser(description="Join pollution to daily weather")
+    parser.add_argument("--idw-stations", action="store_true",
+                        help="Write the IDW weights and the station list to ingest, then stop")
+    parser.add_argument("--idw", action="store_true",
+                        help="Blend the k nearest stations using IDW_WEIGHTS_FILE")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    if args.idw_stations:
+        write_idw_stations()
+    else:
+        stage_pollution()
+        join_pollution_weather(weights=pd.read_csv(IDW_WEIGHTS_FILE) if args.idw else None)
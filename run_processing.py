@@ -1,4 +1,4 @@
-
+import argparse
 from weather_processor import process_weather_files
 
 files_to_process = ["2000.csv.gz",
@@ -19,11 +19,27 @@ files_to_process = ["2000.csv.gz",
                     "2015.csv.gz",
                     "2016.csv.gz",
                     ]
-process_weather_files(
-    file_list=files_to_process,
-    config_path="config/element_config.json",
-    stations_file="Source_Data/Us_City_with_station.csv",
-    output_dir="Not_to_be_shared_to_repo",
-    station_fieldname="ClosestStation",
-    combine_output=False,
-)
+
+# Guard required: worker processes re-import this module when spawned
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest GHCN-Daily weather")
+    parser.add_argument("--idw", action="store_true",
+                        help="Ingest the IDW station list written by "
+                             "pollution_weather_join.py --idw-stations")
+    args = parser.parse_args()
+    # Imported here so spawned workers don't load the join module's imports
+    from pollution_weather_join import IDW_STATIONS_FILE
+
+    process_weather_files(
+        file_list=files_to_process,
+        config_path="config/element_config.json",
+        stations_file=IDW_STATIONS_FILE if args.idw else "Source_Data/Us_City_with_Station.csv",
+        output_dir="Not_to_be_shared_to_repo",
+        station_fieldname="StationId" if args.idw else "ClosestStation",
+        combine_output=False,
+        n_workers=4,                 # one yearly file per worker
+        max_worker_memory_mb=16000,  # fail a year with MemoryError rather than OOM the box
+        chunksize=2_000_000,         # stream each year, memory set by station-days kept
+        output_format="parquet",     # Us_Weather_Parquet/Year=YYYY, no CSV/zip round trip
+        reader="arrow",              # multi-threaded parse, filters on dictionary codes
+    )
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Make the repo root importable however pytest is invoked
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# weather_processor logs to weather_processing.log in the working directory;
+# keep test runs out of the repo's log
+os.chdir(tempfile.mkdtemp(prefix="weather_tests_"))
@@ -0,0 +1,91 @@
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from weather_processor import process_weather_file, process_weather_files
+
+ELEMENTS = {"PRCP": "mean", "TMAX": "max", "TMIN": "min"}
+
+
+def write_ghcn(path, rows):
+    """Writes GHCN-Daily style rows (station, date, element, value)."""
+    with gzip.open(path, "wt") as f:
+        for station, date, element, value in rows:
+            f.write(f"{station},{date},{element},{value},,,S,\n")
+
+
+@pytest.fixture
+def weather_inputs(tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    write_ghcn(input_dir / "2000.csv.gz", [
+        ("US000000001", 20000101, "PRCP", 10),
+        ("US000000001", 20000101, "PRCP", 20),
+        ("US000000001", 20000101, "TMAX", 150),
+        ("US000000002", 20000102, "TMIN", -20),
+        ("US000000002", 20000102, "TMIN", 9999),
+        ("US000000003", 20000102, "TMAX", 300),  # not in the station list
+        ("CA000000001", 20000101, "TMAX", 100),
+    ])
+    config_path = tmp_path / "element_config.json"
+    config_path.write_text(json.dumps(ELEMENTS))
+    # One site has no closest station, as in Us_City_with_Station.csv
+    stations_file = tmp_path / "stations.csv"
+    pd.DataFrame({"ClosestStation": ["US000000001", None, "US000000002"]}).to_csv(
+        stations_file, index=False)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    return input_dir, config_path, stations_file, output_dir
+
+
+@pytest.mark.parametrize("reader", ["pandas", "arrow"])
+def test_process_weather_files_with_missing_station_id(weather_inputs, reader):
+    input_dir, config_path, stations_file, output_dir = weather_inputs
+    process_weather_files(["2000.csv.gz"], str(config_path), str(stations_file),
+                          "ClosestStation", str(output_dir), input_dir=str(input_dir),
+                          output_format="parquet", reader=reader)
+
+    df = pq.read_table(output_dir / "Us_Weather_Parquet" / "Year=2000" / "part-0.parquet").to_pandas()
+    assert df["Station_ID"].tolist() == ["US000000001", "US000000002"]
+    assert df["PRCP"].iloc[0] == 15
+    assert df["TMAX"].iloc[0] == 150
+    assert df["TMIN"].iloc[1] == -20
+    assert np.isnan(df["TMIN"].iloc[0])
+
+
+def test_readers_agree_with_missing_station_id(weather_inputs):
+    input_dir = weather_inputs[0]
+    station_ids = {"US000000001", "US000000002", np.nan, None}
+    frames = [process_weather_file("2000.csv.gz", ELEMENTS, station_ids, str(input_dir),
+                                   reader=reader)
+              for reader in ("pandas", "arrow")]
+    assert len(frames[0]) == 2
+    pd.testing.assert_frame_equal(frames[0], frames[1], check_dtype=False)
+
+
+@pytest.mark.parametrize("chunksize", [None, 2])
+@pytest.mark.parametrize("output_format", ["csv", "parquet"])
+def test_year_with_no_kept_rows(weather_inputs, chunksize, output_format):
+    input_dir, config_path, stations_file, output_dir = weather_inputs
+    write_ghcn(input_dir / "2001.csv.gz", [
+        ("US000000003", 20010101, "TMAX", 100),  # not in the station list
+        ("US000000001", 20010101, "SNOW", 5),    # element not configured
+    ])
+    assert process_weather_file("2001.csv.gz", ELEMENTS, {"US000000001"}, str(input_dir),
+                                chunksize=chunksize).empty
+
+    process_weather_files(["2000.csv.gz", "2001.csv.gz"], str(config_path), str(stations_file),
+                          "ClosestStation", str(output_dir), input_dir=str(input_dir),
+                          chunksize=chunksize, output_format=output_format,
+                          combine_output=True, combined_filename="all.zip")
+    if output_format == "parquet":
+        year = pq.read_table(output_dir / "Us_Weather_Parquet" / "Year=2001" / "part-0.parquet")
+        assert year.num_rows == 0
+        assert pq.read_table(output_dir / "all.parquet").num_rows == 2
+    else:
+        assert pd.read_csv(output_dir / "Us_2001.csv.gz_Weather_Unpacked.zip").empty
+        assert len(pd.read_csv(output_dir / "all.zip")) == 2
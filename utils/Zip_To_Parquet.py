@@ -1,29 +1,206 @@
+import os
+import glob
+import time
+import zipfile
+import argparse
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
-import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _widen(a, b):
+    """Smallest type both chunk types fit in: null defers to the other,
+    mixed numbers become float64 and anything else becomes string."""
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (a, b)):
+        return pa.float64()
+    return pa.string()
 
-def convert_zipped_csv_to_parquet(zip_path, parquet_path, chunksize=100_000):
+
+def _scan_schema(zip_path, chunksize=500_000):
+    """
+    Widens each column's type over every chunk of the CSV. Columns that
+    are empty throughout keep the null type, so a schema merged across
+    files can take their type from the files where they have values.
+    """
+    types = {}
     with zipfile.ZipFile(zip_path) as z:
-        csv_filename = z.namelist()[0]
-        with z.open(csv_filename) as csv_file:
-            writer = None
-            for chunk in pd.read_csv(csv_file, chunksize=chunksize):
-                table = pa.Table.from_pandas(chunk)
+        with z.open(z.namelist()[0]) as csv_file:
+            for chunk in pd.read_csv(csv_file, chunksize=chunksize, low_memory=False):
+                chunk_schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                for field in chunk_schema:
+                    # All-NaN chunks come back as float64; treat them as unknown
+                    field_type = pa.null() if chunk[field.name].isna().all() else field.type
+                    types[field.name] = _widen(types.get(field.name, pa.null()), field_type)
+    return pa.schema(list(types.items()))
+
+
+def _merge_schemas(schemas):
+    """Widens schemas column by column (by name, first seen order), then
+    stores columns that never hold a value as string."""
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types[field.name] = _widen(types.get(field.name, pa.null()), field.type)
+    return pa.schema([(name, pa.string() if pa.types.is_null(t) else t)
+                      for name, t in types.items()])
+
+
+def infer_unified_schema(zip_path, chunksize=500_000):
+    """
+    Infers one schema for the whole CSV by scanning every chunk and widening
+    each column's type, so nulls or floats that only appear late in the file
+    are accounted for (the first chunk alone is not enough).
+
+    Args:
+        zip_path (str): Zip holding a single CSV.
+        chunksize (int): Rows per chunk while scanning.
+
+    Returns:
+        pyarrow.Schema: The unified schema.
+    """
+    return _merge_schemas([_scan_schema(zip_path, chunksize)])
+
+
+def _read_dtypes(schema):
+    """pandas read_csv dtypes that make every chunk come out in the schema."""
+    dtypes = {}
+    for field in schema:
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            dtypes[field.name] = str
+        elif pa.types.is_floating(field.type):
+            dtypes[field.name] = "float64"
+    return dtypes
+
+
+def convert_zipped_csv_to_parquet(zip_path, parquet_path, chunksize=500_000, schema=None,
+                                  compression="snappy", compression_level=None):
+    """
+    Converts the CSV inside a zip to Parquet, streaming it in chunks.
+
+    Args:
+        zip_path (str): Zip holding a single CSV.
+        parquet_path (str): Parquet file to write.
+        chunksize (int): Rows per chunk, and so per Parquet row group.
+        schema (pyarrow.Schema): Schema to write; inferred over the whole
+            file with infer_unified_schema when None.
+        compression (str): Parquet codec (snappy, zstd, gzip, ...).
+        compression_level (int): Optional codec level (e.g. zstd 1-22).
+
+    Returns:
+        dict: Rows, timings and sizes of the conversion.
+    """
+    start = time.perf_counter()
+    if schema is None:
+        schema = infer_unified_schema(zip_path, chunksize)
+
+    rows = 0
+    with zipfile.ZipFile(zip_path) as z:
+        csv_info = z.infolist()[0]
+        with z.open(csv_info) as csv_file:
+            with pq.ParquetWriter(parquet_path, schema, compression=compression,
+                                  compression_level=compression_level) as writer:
+                for chunk in pd.read_csv(csv_file, chunksize=chunksize,
+                                         dtype=_read_dtypes(schema), low_memory=False):
+                    # Columns of a shared schema that this file lacks are all null
+                    for name in schema.names:
+                        if name not in chunk:
+                            chunk[name] = None
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema,
+                                                            preserve_index=False))
+                    rows += len(chunk)
+
+    seconds = time.perf_counter() - start
+    parquet_bytes = os.path.getsize(parquet_path)
+    return {
+        "zip_path": zip_path,
+        "parquet_path": parquet_path,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else float("inf"),
+        "csv_bytes": csv_info.file_size,
+        "zip_bytes": os.path.getsize(zip_path),
+        "parquet_bytes": parquet_bytes,
+        "compression_ratio": csv_info.file_size / parquet_bytes if parquet_bytes else float("inf"),
+    }
+
+
+def _print_stats(stats):
+    print(f"✅ Converted to Parquet: {stats['parquet_path']} | "
+          f"{stats['rows']:,} rows in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_second']:,.0f} rows/s) | "
+          f"CSV {stats['csv_bytes'] / 1e6:,.1f} MB -> Parquet {stats['parquet_bytes'] / 1e6:,.1f} MB "
+          f"({stats['compression_ratio']:.1f}x, zip was {stats['zip_bytes'] / 1e6:,.1f} MB)")
+
+
+def convert_zips_to_parquet(patterns, output_dir=None, n_workers=None, schema=None,
+                            chunksize=500_000, compression="snappy", compression_level=None):
+    """
+    Converts many zipped CSVs to Parquet in a process pool, one file per task,
+    all with the same schema so the outputs read back as one dataset.
+
+    Args:
+        patterns (list[str]): Zip paths or glob patterns.
+        output_dir (str): Directory for the Parquet files (default: next to
+            each zip).
+        n_workers (int): Worker processes (default: one per CPU).
+        schema (pyarrow.Schema): Schema applied to every file; when None it
+            is inferred once over all rows of all files (each file scanned
+            in parallel, then the column types widened across files).
+        chunksize (int): Rows per chunk and per row group.
+        compression (str): Parquet codec.
+        compression_level (int): Optional codec level.
+
+    Returns:
+        list[dict]: Per-file stats, in input order.
+    """
+    zip_paths = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def target(zip_path):
+        name = os.path.splitext(os.path.basename(zip_path))[0] + ".parquet"
+        return os.path.join(output_dir or os.path.dirname(zip_path), name)
 
-                if writer is None:
-                    writer = pq.ParquetWriter(parquet_path, table.schema, compression="snappy")
+    results = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        if schema is None:
+            schema = _merge_schemas(executor.map(_scan_schema, zip_paths,
+                                                 [chunksize] * len(zip_paths)))
+        futures = {
+            executor.submit(convert_zipped_csv_to_parquet, zip_path, target(zip_path),
+                            chunksize, schema, compression, compression_level): zip_path
+            for zip_path in zip_paths
+        }
+        for future in as_completed(futures):
+            stats = future.result()
+            _print_stats(stats)
+            results[futures[future]] = stats
 
-                writer.write_table(table)
+    stats = [results[zip_path] for zip_path in zip_paths]
+    total_rows = sum(s["rows"] for s in stats)
+    total_csv = sum(s["csv_bytes"] for s in stats)
+    total_parquet = sum(s["parquet_bytes"] for s in stats)
+    print(f"Converted {len(stats)} files, {total_rows:,} rows, "
+          f"{total_csv / max(total_parquet, 1):.1f}x smaller than CSV")
+    return stats
 
-            if writer:
-                writer.close()
 
-    print(f"✅ Converted to Parquet: {parquet_path}")
+if __name__ == "__main__":
+    # Example: python -m utils.Zip_To_Parquet "Not_to_be_shared_to_repo/*.zip" --compression zstd
+    parser = argparse.ArgumentParser(description="Convert zipped CSVs to Parquet")
+    parser.add_argument("patterns", nargs="+", help="Zip paths or glob patterns")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=500_000,
+                        help="Rows per chunk and per Parquet row group")
+    parser.add_argument("--compression", default="snappy")
+    parser.add_argument("--compression-level", type=int, default=None)
+    args = parser.parse_args()
 
-# Example usage
-zip_path = "Not_to_be_shared_to_repo//Us_Weather_Final_10km_V2.zip"
-parquet_path = "Not_to_be_shared_to_repo//Us_Weather_Final_10km_V2.parquet"
-convert_zipped_csv_to_parquet(zip_path, parquet_path)
-# Output: ✅ Converted to Outputs//DashBoardData.parquet
-# The function reads a CSV file from a ZIP archive and writes it to a Parquet file in chunks.
\ No newline at end of file
+    convert_zips_to_parquet(args.patterns, args.output_dir, args.workers, None,
+                            args.chunksize, args.compression, args.compression_level)
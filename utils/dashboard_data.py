@@ -0,0 +1,498 @@
+import os
+import re
+import shutil
+import contextlib
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+from utils.simple_logger import logger, log_function_call
+
+# Source zip produced by the notebooks and the columnar store built from it
+DASHBOARD_ZIP = os.path.join("Outputs", "DashBoardData.zip")
+DASHBOARD_STORE = os.path.join("Outputs", "DashBoardData_parquet")
+# Uncompressed Arrow IPC file of the compacted frame, memory-mapped by workers
+DASHBOARD_SNAPSHOT = os.path.join("Outputs", "DashBoardData.arrow")
+# Pre-aggregated Air Quality Map rollups for every time mode and display level
+MAP_CUBE = os.path.join("Outputs", "DashBoardData_map_cube.parquet")
+
+# Hive partitioning of the store: Outputs/DashBoardData_parquet/Year=2009/State=Arizona/
+PARTITIONING = ds.partitioning(
+    pa.schema([("Year", pa.int64()), ("State", pa.string())]),
+    flavor="hive"
+)
+
+# Low cardinality text columns stored as categoricals in memory
+CATEGORY_COLUMNS = ["State", "County", "City", "Address",
+                    "ClosestStation", "StationId", "SiteId"]
+CATEGORY_PATTERN = re.compile(r"^(O3|SO2|CO|NO2)_AQI_Range(_Description)?$")
+# 0/1 weather type flags and the 1-6 AQI groups fit in int8
+INT8_PATTERN = re.compile(r"^(W[TV]\d{2}|(O3|SO2|CO|NO2)_AQI_Group)$")
+# Coordinates keep full precision, every other float is a measurement
+FLOAT64_COLUMNS = ["latitude", "longitude", "StationLatitude", "StationLongitude"]
+
+# Row order of the snapshot; Date first so any date range is one slice
+SORT_ORDER = ["Date", "State", "City"]
+
+# Map cube dimensions, matching the selectors on the Air Quality Map page
+TIME_MODES = ["Day", "Week", "Month", "Quarter", "Year"]
+DISPLAY_LEVELS = {
+    "City": ["City", "State", "WS_Latitude", "WS_Longitude"],
+    "State": ["State"]
+}
+AQI_GROUP_COLUMNS = [f"{m}_AQI_Group" for m in ["NO2", "CO", "SO2", "O3"]]
+
+
+@contextlib.contextmanager
+def _build_lock(target):
+    """
+    Holds an exclusive lock on target + ".lock" while target is built, so
+    concurrent workers build it once, one at a time, and never replace it
+    under each other. Works across processes and across threads.
+    """
+    with open(f"{target}.lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 seconds; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _ensure_built(target, source, build):
+    """Builds target with build() if it is missing or older than source.
+    The check is repeated under the lock, so only the first of several
+    concurrent workers builds it and the others wait and reuse it."""
+    if _is_stale(target, source):
+        with _build_lock(target):
+            if _is_stale(target, source):
+                logger.info(f"{target} missing or stale, building it")
+                build()
+
+
+def _is_stale(target, source):
+    """True if target is missing or older than the source it is built from."""
+    if not os.path.exists(target):
+        return True
+    return (os.path.exists(source)
+            and os.path.getmtime(source) > os.path.getmtime(target))
+
+
+@log_function_call(logger)
+def build_dashboard_store(zip_path=DASHBOARD_ZIP, store_dir=DASHBOARD_STORE):
+    """
+    Converts the dashboard zip into a Parquet dataset partitioned by
+    Year and State.
+
+    The dataset is written to a per-process temporary directory first and
+    swapped in once complete while holding the store's build lock, so
+    readers never see a half written store and concurrent builds do not
+    clash.
+
+    Args:
+        zip_path (str): Path to the zipped DashBoardData CSV.
+        store_dir (str): Directory to write the partitioned dataset to.
+
+    Returns:
+        str: The store directory.
+    """
+    with _build_lock(store_dir):
+        return _write_dashboard_store(zip_path, store_dir)
+
+
+def _write_dashboard_store(zip_path, store_dir):
+    df = pd.read_csv(zip_path, parse_dates=["Date"],
+                     dtype={"SiteId": str}, low_memory=False)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    tmp_dir = f"{store_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    ds.write_dataset(
+        table,
+        tmp_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        existing_data_behavior="delete_matching"
+    )
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    logger.info(f"Built dashboard store with {table.num_rows} rows "
+                f"at {store_dir}")
+    return store_dir
+
+
+def _date_filter(start_date=None, end_date=None, states=None):
+    """
+    Builds the dataset filter expression for a date range and state list.
+
+    The Year bounds are added alongside the Date bounds so whole Year
+    partitions are pruned before any file is opened.
+    """
+    filters = []
+    if start_date is not None:
+        start = pd.Timestamp(start_date)
+        filters += [ds.field("Year") >= start.year,
+                    ds.field("Date") >= start.to_pydatetime()]
+    if end_date is not None:
+        end = pd.Timestamp(end_date)
+        filters += [ds.field("Year") <= end.year,
+                    ds.field("Date") <= end.to_pydatetime()]
+    if states is not None:
+        filters.append(ds.field("State").isin(list(states)))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+    return expression
+
+
+def load_dashboard_data(columns=None, start_date=None, end_date=None,
+                        states=None, store_dir=DASHBOARD_STORE):
+    """
+    Loads the dashboard dataset from the partitioned Parquet store.
+
+    Date and state filters are pushed down to the partitions and only the
+    requested columns are read, so a single day view touches a handful of
+    small files rather than the whole dataset. The store is built from
+    the zip on first use.
+
+    # Load one day of NO2 data for the map
+    df = load_dashboard_data(
+        columns=["Date", "State", "City", "NO2_AQI_Group"],
+        start_date="2009-02-01", end_date="2009-02-01"
+    )
+
+    Args:
+        columns (list, optional): Columns to read. Defaults to all columns.
+        start_date (str or datetime, optional): Inclusive start date.
+        end_date (str or datetime, optional): Inclusive end date.
+        states (list, optional): State names to keep.
+        store_dir (str): Location of the partitioned dataset.
+
+    Returns:
+        DataFrame: The matching rows.
+    """
+    _ensure_built(store_dir, DASHBOARD_ZIP,
+                  lambda: _write_dashboard_store(DASHBOARD_ZIP, store_dir))
+
+    dataset = ds.dataset(store_dir, format="parquet",
+                         partitioning=PARTITIONING)
+    table = dataset.to_table(
+        columns=list(columns) if columns is not None else None,
+        filter=_date_filter(start_date, end_date, states)
+    )
+    return table.to_pandas()
+
+
+def compact_dtypes(df):
+    """
+    Downcasts the dashboard frame to compact dtypes.
+
+    Location and AQI range text becomes categorical, weather type flags
+    and AQI groups become int8 (nullable Int8 when a column has gaps),
+    measurements become float32 and the remaining integers are downcast.
+
+    Args:
+        df (DataFrame): Dashboard data as returned by load_dashboard_data.
+
+    Returns:
+        DataFrame: A new frame with compact dtypes.
+    """
+    compact = {}
+    for col in df.columns:
+        series = df[col]
+        if col in CATEGORY_COLUMNS or CATEGORY_PATTERN.match(col):
+            compact[col] = series.astype("category")
+        elif INT8_PATTERN.match(col):
+            compact[col] = series.astype("Int8" if series.isna().any() else "int8")
+        elif pd.api.types.is_float_dtype(series) and col not in FLOAT64_COLUMNS:
+            compact[col] = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(series):
+            compact[col] = pd.to_numeric(series, downcast="integer")
+        else:
+            compact[col] = series
+    return pd.DataFrame(compact, index=df.index)
+
+
+@log_function_call(logger)
+def write_dashboard_snapshot(snapshot_path=DASHBOARD_SNAPSHOT,
+                             store_dir=DASHBOARD_STORE):
+    """
+    Writes the compacted dashboard frame to an Arrow IPC (Feather v2) file.
+
+    Rows are sorted by Date, then State and City, so date ranges are
+    contiguous (see date_slice). The file is left uncompressed so it can
+    be memory-mapped and read without copying. It is written under a
+    per-process temporary name and renamed into place while holding the
+    snapshot's build lock, so concurrent workers never read a partial file.
+
+    Args:
+        snapshot_path (str): Path of the Arrow file to write.
+        store_dir (str): Location of the partitioned dataset to read from.
+
+    Returns:
+        str: The snapshot path.
+    """
+    with _build_lock(snapshot_path):
+        return _write_dashboard_snapshot(snapshot_path, store_dir)
+
+
+def _write_dashboard_snapshot(snapshot_path=DASHBOARD_SNAPSHOT, store_dir=DASHBOARD_STORE):
+    df = compact_dtypes(load_dashboard_data(store_dir=store_dir))
+    df = df.sort_values(SORT_ORDER, kind="stable")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, snapshot_path)
+    logger.info(f"Wrote dashboard snapshot with {table.num_rows} rows "
+                f"to {snapshot_path}")
+    return snapshot_path
+
+
+def load_dashboard_snapshot(snapshot_path=DASHBOARD_SNAPSHOT):
+    """
+    Memory-maps the Arrow snapshot and wraps it in a DataFrame.
+
+    Numeric and date columns point straight at the mapped file, so every
+    worker on a host shares one page-cached copy and the arrays are
+    read-only.
+
+    Args:
+        snapshot_path (str): Path of the Arrow file written by
+            write_dashboard_snapshot.
+
+    Returns:
+        DataFrame: The dashboard data with compact dtypes.
+    """
+    source = pa.memory_map(snapshot_path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    # One block per column keeps pandas from consolidating (copying) arrays
+    return table.to_pandas(split_blocks=True)
+
+
+@st.cache_resource(show_spinner="Loading dashboard data...")
+def get_dashboard_data():
+    """
+    Returns the full dashboard dataset, shared by every page and session.
+
+    The frame is held once per process with st.cache_resource, so reruns
+    neither reload nor copy it, and is backed by the memory-mapped
+    snapshot, which is (re)written on first use if the offline step has
+    not been run since the zip last changed. Treat it as read-only: filter or take a copy before adding
+    or changing columns.
+
+    Returns:
+        DataFrame: The dashboard data with compact dtypes.
+    """
+    _ensure_built(DASHBOARD_SNAPSHOT, DASHBOARD_ZIP, _write_dashboard_snapshot)
+    df = load_dashboard_snapshot()
+    if not df["Date"].is_monotonic_increasing:
+        # Snapshot written before rows were kept in date order; another
+        # worker may already have rewritten it while we waited for the lock
+        with _build_lock(DASHBOARD_SNAPSHOT):
+            df = load_dashboard_snapshot()
+            if not df["Date"].is_monotonic_increasing:
+                logger.info(f"Dashboard snapshot is unsorted, rewriting {DASHBOARD_SNAPSHOT}")
+                _write_dashboard_snapshot()
+                df = load_dashboard_snapshot()
+    logger.info(f"Mapped dashboard data: {df.shape}")
+    return df
+
+
+def date_slice(df, start_date, end_date=None):
+    """
+    Returns the rows dated start_date to end_date inclusive.
+
+    The frame must be sorted by Date, as get_dashboard_data is. The bounds
+    are found with a binary search on the Date column and the result is a
+    positional slice, so no mask is built and no rows are copied.
+
+    # All rows for one day, then for February 2009
+    day = date_slice(get_dashboard_data(), "2009-02-01")
+    month = date_slice(get_dashboard_data(), "2009-02-01", "2009-02-28")
+
+    Args:
+        df (DataFrame): Frame sorted by Date.
+        start_date (str or datetime): Inclusive start date.
+        end_date (str or datetime, optional): Inclusive end date. Defaults
+            to start_date, giving a single day.
+
+    Returns:
+        DataFrame: The matching rows. Shares memory with df, so do not
+        modify it in place.
+    """
+    if end_date is None:
+        end_date = start_date
+    dates = df["Date"].to_numpy()
+    start = dates.searchsorted(np.datetime64(pd.Timestamp(start_date)), side="left")
+    stop = dates.searchsorted(np.datetime64(pd.Timestamp(end_date)), side="right")
+    return df.iloc[start:stop]
+
+
+def period_slice(df, mode, selected_date):
+    """
+    Returns the rows of the Day, Week, Month, Quarter or Year containing
+    selected_date, using date_slice.
+    """
+    return date_slice(df, *period_bounds(mode, selected_date))
+
+
+def period_bounds(mode, selected_date):
+    """
+    Returns the inclusive first and last day of the period containing
+    selected_date.
+
+    Weeks are ISO weeks (Monday to Sunday), matching the map page.
+
+    Args:
+        mode (str): One of "Day", "Week", "Month", "Quarter" or "Year".
+        selected_date (str or datetime): Any date within the period.
+
+    Returns:
+        tuple: (start, end) Timestamps.
+    """
+    period = pd.Timestamp(selected_date).to_period(mode[0])
+    return period.start_time.normalize(), period.end_time.normalize()
+
+
+@log_function_call(logger)
+def build_map_cube(cube_path=MAP_CUBE, store_dir=DASHBOARD_STORE):
+    """
+    Pre-aggregates the Air Quality Map for every time mode and display level.
+
+    For each period (Day, ISO Week, Month, Quarter, Year) and each City or
+    State, the cube holds the mean of every *_AQI_Group and the max of
+    every WT flag, i.e. exactly what the map page used to compute with a
+    groupby on each rerun. Rows are stored long, tagged with Mode, Level
+    and the period start date.
+
+    Args:
+        cube_path (str): Parquet file to write the cube to.
+        store_dir (str): Location of the partitioned dataset.
+
+    Returns:
+        str: The cube path.
+    """
+    with _build_lock(cube_path):
+        return _write_map_cube(cube_path, store_dir)
+
+
+def _write_map_cube(cube_path=MAP_CUBE, store_dir=DASHBOARD_STORE):
+    df = load_dashboard_data(store_dir=store_dir)
+    df = df.rename(columns={"StationLatitude": "WS_Latitude",
+                            "StationLongitude": "WS_Longitude"})
+    weather_cols = [col for col in df.columns if re.match(r"^WT\d{2}$", col)]
+    agg_dict = {col: "mean" for col in AQI_GROUP_COLUMNS}
+    agg_dict.update({col: "max" for col in weather_cols})
+
+    parts = []
+    for mode in TIME_MODES:
+        period = df["Date"].dt.to_period(mode[0]).dt.start_time.rename("Period")
+        for level, keys in DISPLAY_LEVELS.items():
+            part = (df.groupby([period] + keys, observed=True)
+                    .agg(agg_dict)
+                    .reset_index())
+            part.insert(0, "Level", level)
+            part.insert(0, "Mode", mode)
+            parts.append(part)
+
+    cube = pd.concat(parts, ignore_index=True)
+    cube[AQI_GROUP_COLUMNS] = cube[AQI_GROUP_COLUMNS].astype(np.float32)
+    cube[weather_cols] = cube[weather_cols].astype(np.int8)
+
+    tmp_path = f"{cube_path}.{os.getpid()}.tmp"
+    cube.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cube_path)
+    logger.info(f"Wrote map cube with {len(cube)} rows to {cube_path}")
+    return cube_path
+
+
+def _index_map_cube(cube_df):
+    """
+    Splits the long cube into one frame per (Mode, Level), sorted by period,
+    plus a dict from period start to its (start, stop) row range.
+    """
+    key_cols = {col for keys in DISPLAY_LEVELS.values() for col in keys}
+    cube = {}
+    for (mode, level), part in cube_df.groupby(["Mode", "Level"], sort=False):
+        unused = ["Mode", "Level"] + sorted(key_cols - set(DISPLAY_LEVELS[level]))
+        part = (part.drop(columns=unused)
+                .sort_values("Period", kind="stable")
+                .reset_index(drop=True))
+        periods = part["Period"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        stops = np.r_[starts[1:], len(part)]
+        offsets = {pd.Timestamp(periods[start]): (start, stop)
+                   for start, stop in zip(starts, stops)}
+        cube[(mode, level)] = (part, offsets)
+    return cube
+
+
+@st.cache_resource(show_spinner="Loading map aggregates...")
+def get_map_cube():
+    """
+    Returns the indexed map cube, shared by every session.
+
+    The cube is (re)built on first use if it is missing or older than
+    DashBoardData.zip.
+
+    Returns:
+        dict: (mode, level) -> (DataFrame, {period start: (start, stop)}).
+    """
+    _ensure_built(MAP_CUBE, DASHBOARD_ZIP, _write_map_cube)
+    return _index_map_cube(pd.read_parquet(MAP_CUBE))
+
+
+def lookup_map_cube(cube, mode, display_level, selected_date):
+    """
+    Returns the pre-aggregated rows for the period containing selected_date.
+
+    This is a dict lookup plus a row slice, so switching period, measure
+    or level costs the same however much data sits behind the map.
+
+    # NO2 by state for February 2009
+    df = lookup_map_cube(get_map_cube(), "Month", "State", "2009-02-01")
+    df[["State", "NO2_AQI_Group"]]
+
+    Args:
+        cube (dict): Indexed cube from get_map_cube.
+        mode (str): One of TIME_MODES.
+        display_level (str): "City" or "State".
+        selected_date (str or datetime): Any date within the period.
+
+    Returns:
+        DataFrame: One row per City or State. Empty if the period has no
+        data. The frame is shared, so do not modify it in place.
+    """
+    frame, offsets = cube[(mode, display_level)]
+    start, stop = offsets.get(period_bounds(mode, selected_date)[0], (0, 0))
+    return frame.iloc[start:stop]
+
+
+if __name__ == "__main__":
+    # Offline step: python -m utils.dashboard_data
+    build_dashboard_store()
+    write_dashboard_snapshot()
+    build_map_cube()
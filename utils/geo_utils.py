@@ -1,22 +1,98 @@
 import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
 import pandas as pd
 import numpy as np
-from google.cloud import api_keys_v2
-from google.cloud.api_keys_v2 import Key
-from geopy.exc import GeocoderTimedOut
 import time
-from geopy.geocoders import GoogleV3
 from utils.simple_logger import logger, log_function_call
 
-# Initialize the geolocator
-# Load the API key from an environment variable
-api_key = os.getenv("GOOGLE_API_KEY")
-
-if not api_key:
-    raise RuntimeError("Google API key not found. Please set "
-                       "the GOOGLE_API_KEY environment variable.")
+if TYPE_CHECKING:
+    from google.cloud.api_keys_v2 import Key
+
+# The geocoder clients (GoogleV3, google.cloud.api_keys_v2) are heavy to
+# import and need GOOGLE_API_KEY, so they are created on first use; the
+# distance and matching helpers work without them (scipy is only imported
+# by haversine_knn). Set GEO_UTILS_OFFLINE=1 to geocode against the local
+# US cities table instead of the network.
+OFFLINE_GEOCODING = os.getenv("GEO_UTILS_OFFLINE", "").lower() in ("1", "true", "yes")
+LOCAL_CITIES_ZIP = os.path.join("Source_Data", "simplemaps_uscities_basicv1.90.zip")
+
+_geolocator = None
+_local_geocoder = None
+_client_lock = threading.Lock()
+
+# Persistent geocoding cache keyed on the normalized address. Found
+# addresses are kept for GEOCODE_TTL_SECONDS; "not found" results are
+# cached too, but only for NEGATIVE_TTL_SECONDS so they get retried.
+# Timeouts and other errors are never cached.
+GEOCODE_CACHE = os.path.join("Outputs", "geocode_cache.sqlite")
+GEOCODE_TTL_SECONDS = 180 * 24 * 3600
+NEGATIVE_TTL_SECONDS = 7 * 24 * 3600
+# Pause after each real geocoder request to stay inside the rate limit
+GEOCODE_DELAY_SECONDS = 1
+# Batch geocoding: provider requests per second (token bucket rate and
+# burst), worker threads and GeocoderTimedOut retries with exponential backoff
+GEOCODE_RATE_PER_SECOND = 10
+GEOCODE_WORKERS = 8
+GEOCODE_MAX_RETRIES = 3
+GEOCODE_BACKOFF_SECONDS = 1
+
+EMPTY_GEOLOCATION = {'latitude': None, 'longitude': None, 'address': None}
+
+
+# Columns searched for a location name, in priority order
+LOCATION_SEARCH_COLUMNS = ['city', 'city_ascii', 'country',
+                           'iso2', 'iso3', 'admin_name']
+
+
+class LocationIndex:
+    """
+    Hash index over worldcities_df for find_location_match. Each search
+    column is normalized once and mapped from value to its first row, so a
+    lookup is a handful of dict probes instead of scanning the frame.
+
+    index = LocationIndex(worldcities_df)
+    index.lookup("Denver")
+    # {'matched_value': 'Denver', 'matched_column': 'city', ...}
+    index.lookup_many(["Denver", "Paris", "Atlantis"])
+    # [{...}, {...}, None]
+    """
 
-geolocator = GoogleV3(api_key=api_key)
+    def __init__(self, worldcities_df, search_columns=LOCATION_SEARCH_COLUMNS):
+        self.search_columns = list(search_columns)
+        self.values = {col: worldcities_df[col].tolist() for col in self.search_columns}
+        self.latitudes = worldcities_df['lat'].tolist()
+        self.longitudes = worldcities_df['lng'].tolist()
+        self.countries = worldcities_df['country'].tolist()
+        self.positions = {}
+        for col in self.search_columns:
+            normalized = worldcities_df[col].astype(str).str.strip().str.lower().tolist()
+            # Insert in reverse so the first row wins, as with match.iloc[0]
+            self.positions[col] = dict(zip(reversed(normalized),
+                                           range(len(normalized) - 1, -1, -1)))
+
+    def lookup(self, location):
+        """Same result as find_location_match(location, worldcities_df)."""
+        location = str(location).strip().lower()
+        for col in self.search_columns:
+            position = self.positions[col].get(location)
+            if position is not None:
+                return {
+                    'matched_value': self.values[col][position],
+                    'matched_column': col,
+                    'latitude': self.latitudes[position],
+                    'longitude': self.longitudes[position],
+                    'country': self.countries[position]
+                }
+        return None
+
+    def lookup_many(self, locations):
+        """lookup for each location, in input order."""
+        return [self.lookup(location) for location in locations]
 
 
 # Function to extract geolocation details
@@ -24,9 +100,13 @@ def find_location_match(location, worldcities_df):
     """
     Search for a location in multiple columns of worldcities_df.
 
+    For more than a few lookups build a LocationIndex once and pass it in
+    place of the frame; each lookup is then O(1).
+
     Args:
         location (str): The location to search for.
-        worldcities_df (DataFrame): The dataframe containing city data.
+        worldcities_df (DataFrame or LocationIndex): The dataframe
+            containing city data, or an index built from it.
 
     Returns:
         dict: A dictionary containing the matched value, the column it was
@@ -39,8 +119,10 @@ def find_location_match(location, worldcities_df):
         print(result)
         # {'matched_value': 'Denver', 'matched_column': 'city', 'latitude': 39.7392358, 'longitude': -104.990251, 'country': 'United States'}
     """
-    search_columns = ['city', 'city_ascii', 'country',
-                      'iso2', 'iso3', 'admin_name']
+    if isinstance(worldcities_df, LocationIndex):
+        return worldcities_df.lookup(location)
+
+    search_columns = LOCATION_SEARCH_COLUMNS
 
     # Convert input to string and lowercase for case-insensitive comparison
     location = str(location).strip().lower()
@@ -66,59 +148,385 @@ def find_location_match(location, worldcities_df):
     return None  # Return None if no match is found
 
 
+# Result of LocalGeocoder.geocode, with the attributes used from geopy's Location
+LocalLocation = namedtuple("LocalLocation", ["latitude", "longitude", "address"])
+
+
+class LocalGeocoder:
+    """
+    Offline geocoder over the simplemaps US cities table, with the same
+    geocode(query, timeout=...) call as geopy. It resolves a query to a
+    city: by 5 digit ZIP code if present, otherwise by a "city, state"
+    pair found in the comma separated parts, otherwise by city name alone
+    (the most populous match). Street level addresses resolve to their
+    city's centre.
+    """
+
+    def __init__(self, cities_zip=LOCAL_CITIES_ZIP):
+        cities = pd.read_csv(cities_zip, usecols=["city", "city_ascii", "state_id", "state_name",
+                                                  "lat", "lng", "population", "zips"])
+        cities = cities.sort_values("population", ascending=False, kind="stable")
+        self.cities = cities.reset_index(drop=True)
+        self.states = {}
+        for state_id, state_name in zip(cities["state_id"], cities["state_name"]):
+            self.states[state_id.lower()] = state_id
+            self.states[state_name.lower()] = state_id
+
+        # First (most populous) row wins for every key
+        self.by_city_state, self.by_city, self.by_zip = {}, {}, {}
+        for row, city, city_ascii, state_id, zips in zip(
+                range(len(cities)), cities["city"], cities["city_ascii"],
+                cities["state_id"], cities["zips"].fillna("")):
+            for name in {city.lower(), city_ascii.lower()}:
+                self.by_city_state.setdefault((name, state_id), row)
+                self.by_city.setdefault(name, row)
+            for zip_code in str(zips).split():
+                self.by_zip.setdefault(zip_code, row)
+
+    def _find_row(self, query):
+        zip_match = re.search(r"\b(\d{5})(?:-\d{4})?\b", query)
+        if zip_match and zip_match.group(1) in self.by_zip:
+            return self.by_zip[zip_match.group(1)]
+
+        parts = [re.sub(r"\s+", " ", part).strip() for part in query.lower().split(",")]
+        parts = [part for part in parts if part and part not in ("usa", "us", "united states")]
+        for i in range(len(parts) - 1, -1, -1):
+            # "az", "arizona" or "az 85006"
+            state_id = self.states.get(re.sub(r"\s*\d{5}(-\d{4})?$", "", parts[i]))
+            if state_id is None:
+                continue
+            for city in reversed(parts[:i]):
+                if (city, state_id) in self.by_city_state:
+                    return self.by_city_state[(city, state_id)]
+        for city in reversed(parts):
+            if city in self.by_city:
+                return self.by_city[city]
+        return None
+
+    def geocode(self, query, timeout=None):
+        row = self._find_row(str(query))
+        if row is None:
+            return None
+        city = self.cities.iloc[row]
+        return LocalLocation(float(city["lat"]), float(city["lng"]),
+                             f"{city['city']}, {city['state_id']}, USA")
+
+
+def get_local_geocoder():
+    """The shared LocalGeocoder, built on first use."""
+    global _local_geocoder
+    with _client_lock:
+        if _local_geocoder is None:
+            _local_geocoder = LocalGeocoder()
+        return _local_geocoder
+
+
+def get_geolocator(offline=None):
+    """
+    The default geocoder, created on first use: GoogleV3 with
+    GOOGLE_API_KEY, or the LocalGeocoder in offline mode.
+
+    Args:
+        offline (bool): Force offline mode on or off; defaults to the
+            GEO_UTILS_OFFLINE environment variable.
+    """
+    global _geolocator
+    if OFFLINE_GEOCODING if offline is None else offline:
+        return get_local_geocoder()
+    with _client_lock:
+        if _geolocator is None:
+            # Load the API key from an environment variable
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise RuntimeError("Google API key not found. Please set "
+                                   "the GOOGLE_API_KEY environment variable "
+                                   "(or GEO_UTILS_OFFLINE=1 to geocode locally).")
+            from geopy.geocoders import GoogleV3
+            _geolocator = GoogleV3(api_key=api_key)
+        return _geolocator
+
+
+def __getattr__(name):
+    # Keep geo_utils.geolocator working for existing callers
+    if name == "geolocator":
+        return get_geolocator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def normalize_address(location):
+    """Cache key for a location: lowercased, trimmed, single spaced."""
+    return re.sub(r"\s+", " ", str(location).strip().lower())
+
+
+def _connect_cache(cache_path):
+    """Opens the geocoding cache, creating it if needed."""
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(cache_path, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS geocode_cache ("
+        "address TEXT PRIMARY KEY, latitude REAL, longitude REAL, "
+        "formatted_address TEXT, found INTEGER NOT NULL, fetched_at REAL NOT NULL)"
+    )
+    return conn
+
+
+def _cached_results(conn, keys, ttl, negative_ttl):
+    """Unexpired cache entries for the given keys, as {key: result}."""
+    now = time.time()
+    results = {}
+    keys = list(keys)
+    # Stay under SQLite's bound parameter limit
+    for start in range(0, len(keys), 500):
+        batch = keys[start:start + 500]
+        rows = conn.execute(
+            "SELECT address, latitude, longitude, formatted_address, found, fetched_at "
+            f"FROM geocode_cache WHERE address IN ({','.join('?' * len(batch))})",
+            batch
+        )
+        for key, lat, lng, address, found, fetched_at in rows:
+            if now - fetched_at <= (ttl if found else negative_ttl):
+                results[key] = {'latitude': lat, 'longitude': lng, 'address': address}
+    return results
+
+
+def _store_result(conn, key, result):
+    conn.execute(
+        "INSERT OR REPLACE INTO geocode_cache VALUES (?, ?, ?, ?, ?, ?)",
+        (key, result['latitude'], result['longitude'], result['address'],
+         int(result['address'] is not None), time.time())
+    )
+    conn.commit()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: acquire() blocks until a token is available.
+    Tokens refill at rate per second up to burst, so sustained throughput
+    matches the provider quota while short bursts are allowed.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _geocode(location, geocoder, limiter=None, max_retries=0,
+             backoff=GEOCODE_BACKOFF_SECONDS):
+    """
+    Calls the geocoder, waiting on limiter before each attempt and retrying
+    GeocoderTimedOut up to max_retries times with exponential backoff.
+
+    Returns:
+        tuple: (result dict, cacheable). Not found is cacheable; timeouts
+        and errors are not.
+    """
+    from geopy.exc import GeocoderTimedOut
+
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            location_info = geocoder.geocode(location, timeout=10)
+            break
+        except GeocoderTimedOut:
+            if attempt == max_retries:
+                print(location)
+                return dict(EMPTY_GEOLOCATION), False
+            time.sleep(backoff * 2 ** attempt)
+        except Exception as e:
+            print(f"Geocoding error: {e}")
+            return dict(EMPTY_GEOLOCATION), False
+
+    if not location_info:
+        return dict(EMPTY_GEOLOCATION), True
+    return {
+        'latitude': location_info.latitude,
+        'longitude': location_info.longitude,
+        'address': location_info.address
+    }, True
+
+
 # Function to get geolocation information
 @log_function_call(logger)
-def get_geolocation_info(location):
+def get_geolocation_info(location, geocoder=None, cache_path=GEOCODE_CACHE,
+                         ttl=GEOCODE_TTL_SECONDS, negative_ttl=NEGATIVE_TTL_SECONDS,
+                         delay=GEOCODE_DELAY_SECONDS):
     """
-    _summary_
-    # Get coordinates and formatted address from a location string
+    Get coordinates and formatted address from a location string, using
+    the persistent cache first. Cache hits skip both the request and the
+    rate-limit delay.
+
     geo_data = get_geolocation_info(address)
     print(geo_data)
     # {'latitude': 39.7785547, 'longitude': -105.0144273, 'address': '...Google full address...'}
 
     Args:
-        location (_type_): _description_
+        location (str): Address or place name.
+        geocoder: Object with a geopy style geocode(query, timeout=...)
+            method; defaults to get_geolocator() (GoogleV3, or the
+            LocalGeocoder offline). Tests can pass a local stub.
+        cache_path (str): SQLite cache file, or None to bypass the cache.
+        ttl (float): Seconds a found address stays cached.
+        negative_ttl (float): Seconds a not found address stays cached.
+        delay (float): Seconds to wait after each real request.
 
     Returns:
-        _type_: _description_
+        dict: latitude, longitude and address (all None if not found).
     """
-    usetimedelay = True
+    geocoder = geocoder or get_geolocator()
+    if isinstance(geocoder, LocalGeocoder):
+        # Local lookups are instant and shouldn't mix with provider results
+        cache_path, delay = None, 0
+    key = normalize_address(location)
+
+    conn = _connect_cache(cache_path) if cache_path else None
     try:
-        location_info = geolocator.geocode(location, timeout=10)
-        if location_info:
-            if usetimedelay:
-                time.sleep(1)
-            return {
-                'latitude': location_info.latitude,
-                'longitude': location_info.longitude,
-                'address': location_info.address
-            }
-        else:
-            if usetimedelay:
-                time.sleep(1)
-            return {
-                'latitude': None,
-                'longitude': None,
-                'address': None
-            }
-    except GeocoderTimedOut:
-        print(location)
-        if usetimedelay:
-            time.sleep(1)
-        return {
-            'latitude': None,
-            'longitude': None,
-            'address': None
-        }
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-        if usetimedelay:
-            time.sleep(1)
-        return {
-            'latitude': None,
-            'longitude': None,
-            'address': None
+        if conn is not None:
+            cached = _cached_results(conn, [key], ttl, negative_ttl)
+            if key in cached:
+                return cached[key]
+
+        result, cacheable = _geocode(location, geocoder)
+        if delay:
+            time.sleep(delay)
+        if conn is not None and cacheable:
+            _store_result(conn, key, result)
+        return result
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def _geocode_concurrently(locations, geocoder, limiter, max_workers, max_retries, backoff):
+    """Yields (key, (result, cacheable)) for {key: location} as requests
+    complete, max_workers at a time through the limiter."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_geocode, location, geocoder, limiter,
+                            max_retries, backoff): key
+            for key, location in locations.items()
         }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _resolve_locations(locations, geocoder, cache_path, ttl, negative_ttl,
+                       rate, max_workers, max_retries, backoff):
+    """
+    Geocodes the unique uncached locations concurrently through a token
+    bucket, writing each result to the cache as it completes (the SQLite
+    connection stays on the calling thread). A LocalGeocoder is queried
+    inline, without the cache, the rate limit or the thread pool.
+
+    Returns:
+        tuple: ({normalized address: result}, stats dict)
+    """
+    geocoder = geocoder or get_geolocator()
+    local = isinstance(geocoder, LocalGeocoder)
+    if local:
+        cache_path = None
+    unique = {}
+    for location in locations:
+        unique.setdefault(normalize_address(location), location)
+
+    conn = _connect_cache(cache_path) if cache_path else None
+    try:
+        results = _cached_results(conn, unique, ttl, negative_ttl) if conn else {}
+        stats = {'unique': len(unique), 'cached': len(results), 'fetched': 0, 'failed': 0}
+        missing = {key: location for key, location in unique.items() if key not in results}
+
+        if local:
+            # Local lookups are dict reads: no rate limit, no threads
+            completed = ((key, _geocode(location, geocoder)) for key, location in missing.items())
+        else:
+            completed = _geocode_concurrently(missing, geocoder, TokenBucket(rate),
+                                              max_workers, max_retries, backoff)
+        for key, (result, cacheable) in completed:
+            results[key] = result
+            if cacheable:
+                stats['fetched'] += 1
+                if conn is not None:
+                    _store_result(conn, key, result)
+            else:
+                stats['failed'] += 1
+    finally:
+        if conn is not None:
+            conn.close()
+    return results, stats
+
+
+@log_function_call(logger)
+def geocode_batch(locations, geocoder=None, cache_path=GEOCODE_CACHE,
+                  ttl=GEOCODE_TTL_SECONDS, negative_ttl=NEGATIVE_TTL_SECONDS,
+                  rate=GEOCODE_RATE_PER_SECOND, max_workers=GEOCODE_WORKERS,
+                  max_retries=GEOCODE_MAX_RETRIES, backoff=GEOCODE_BACKOFF_SECONDS):
+    """
+    Geocodes many locations concurrently at the provider's rate limit
+    instead of one request per second.
+
+    results = geocode_batch(pollution_df['Address'])
+    pollution_df[['latitude', 'longitude', 'formatted_address']] = pd.DataFrame(results)
+
+    Args:
+        locations (iterable[str]): Addresses or place names.
+        geocoder: geopy style geocoder (default get_geolocator()); tests
+            can pass a stub.
+        cache_path (str): SQLite cache file, or None to bypass the cache.
+        ttl, negative_ttl (float): As for get_geolocation_info.
+        rate (float): Requests per second allowed by the provider.
+        max_workers (int): Concurrent requests in flight.
+        max_retries (int): Retries of a timed out request.
+        backoff (float): First retry delay in seconds, doubled each retry.
+
+    Returns:
+        list[dict]: One result per input location, in input order.
+    """
+    locations = list(locations)
+    results, stats = _resolve_locations(locations, geocoder, cache_path, ttl, negative_ttl,
+                                        rate, max_workers, max_retries, backoff)
+    logger.info(f"Batch geocode: {stats}")
+    return [dict(results[normalize_address(location)]) for location in locations]
+
+
+@log_function_call(logger)
+def prewarm_geocode_cache(locations, geocoder=None, cache_path=GEOCODE_CACHE,
+                          ttl=GEOCODE_TTL_SECONDS, negative_ttl=NEGATIVE_TTL_SECONDS,
+                          rate=GEOCODE_RATE_PER_SECOND, max_workers=GEOCODE_WORKERS,
+                          max_retries=GEOCODE_MAX_RETRIES, backoff=GEOCODE_BACKOFF_SECONDS):
+    """
+    Geocodes every location that is not already cached, so later
+    get_geolocation_info calls are served from the cache. Duplicate
+    addresses (after normalization) are requested once.
+
+    Args:
+        locations (iterable[str]): Addresses or place names.
+        Other arguments: As for geocode_batch.
+
+    Returns:
+        dict: Counts of unique, already cached, fetched and failed locations.
+    """
+    _, stats = _resolve_locations(locations, geocoder, cache_path, ttl, negative_ttl,
+                                  rate, max_workers, max_retries, backoff)
+    logger.info(f"Geocode cache pre-warm: {stats}")
+    return stats
 
 
 # Function to extract geolocation details
@@ -146,6 +554,20 @@ def extract_geolocation_details(address):
         return None, None, None
 
 
+def ner_disabled_pipes(nlp):
+    """
+    Pipeline components not needed for named entities: everything except
+    ner and, if ner listens to it, the shared tok2vec (in en_core_web_sm
+    ner has its own, so the tagger, parser, lemmatizer etc. all go).
+    """
+    keep = {"ner"}
+    if "tok2vec" in nlp.pipe_names:
+        listeners = getattr(nlp.get_pipe("tok2vec"), "listening_components", [])
+        if "ner" in listeners:
+            keep.add("tok2vec")
+    return [name for name in nlp.pipe_names if name not in keep]
+
+
 @log_function_call(logger)
 def extract_locations(text, keyword_processor, nlp):
     """
@@ -168,7 +590,7 @@ def extract_locations(text, keyword_processor, nlp):
     # convert text to string
     text = str(text)
     # Use NLP to extract geographic locations (GPE entities)
-    doc = nlp(text)
+    doc = nlp(text, disable=ner_disabled_pipes(nlp))
     nlp_locations = (
         {ent.text.lower() for ent in doc.ents if ent.label_ == "GPE"})
     logger.debug(f"NLP Extracted Locations: {nlp_locations}")
@@ -189,7 +611,45 @@ def extract_locations(text, keyword_processor, nlp):
 
 
 @log_function_call(logger)
-def restrict_api_key_server(project_id: str, key_id: str) -> Key:
+def extract_locations_batch(texts, keyword_processor, nlp, batch_size=1000, n_process=1):
+    """
+    Batch version of extract_locations for large corpora: texts are
+    streamed through nlp.pipe with only the NER components enabled, and
+    the keyword pass runs on each document as it comes back.
+
+    locations = extract_locations_batch(df['text'], keyword_processor, nlp,
+                                        batch_size=2000, n_process=4)
+    df['locations'] = locations
+
+    Args:
+        texts (iterable): Texts to scan (non strings are converted with str).
+        keyword_processor: flashtext KeywordProcessor of known locations.
+        nlp: Loaded spaCy pipeline (e.g. en_core_web_sm).
+        batch_size (int): Texts per spaCy batch.
+        n_process (int): spaCy worker processes (-1 for one per CPU).
+
+    Returns:
+        list[list[str]]: The locations of each text, in input order, same as
+        extract_locations: keyword matches if any, else GPE entities.
+    """
+    texts = [str(text) for text in texts]
+    docs = nlp.pipe(texts, batch_size=batch_size, n_process=n_process,
+                    disable=ner_disabled_pipes(nlp))
+
+    results = []
+    for text, doc in zip(texts, docs):
+        matched_locations = set(keyword_processor.extract_keywords(text.lower()))
+        if matched_locations:
+            results.append(list(matched_locations))
+        else:
+            results.append(list({ent.text.lower() for ent in doc.ents
+                                 if ent.label_ == "GPE"}))
+    logger.debug(f"Extracted locations from {len(results)} texts")
+    return results
+
+
+@log_function_call(logger)
+def restrict_api_key_server(project_id: str, key_id: str) -> "Key":
     """
     Restricts the API key based on IP addresses. You can specify one or
     more IP addresses of the callers,
@@ -207,6 +667,7 @@ def restrict_api_key_server(project_id: str, key_id: str) -> Key:
     Returns:
         response: Returns the updated API Key.
     """
+    from google.cloud import api_keys_v2
 
     # Create the API Keys client.
     client = api_keys_v2.ApiKeysClient()
@@ -239,11 +700,14 @@ def restrict_api_key_server(project_id: str, key_id: str) -> Key:
     # Use response.key_string to authenticate.
     return response
 
+EARTH_RADIUS_KM = 6371
+
+
 def haversine_vectorized(lat1, lon1, lat2_array, lon2_array):
     """
     Vectorized haversine distance calculation between one point and arrays of points.
     """
-    R = 6371  # Earth radius in km
+    R = EARTH_RADIUS_KM
     lat1, lon1 = np.radians(lat1), np.radians(lon1)
     lat2, lon2 = np.radians(lat2_array), np.radians(lon2_array)
 
@@ -256,15 +720,79 @@ def haversine_vectorized(lat1, lon1, lat2_array, lon2_array):
     return R * c  # Distance in km
 
 
+def _unit_vectors(lat, lon):
+    """Degrees to 3D points on the unit sphere."""
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def haversine_knn(query_lat, query_lon, ref_lat, ref_lon, k=1, radius_km=None):
+    """
+    k nearest reference points of every query point by great circle
+    distance. Points are placed on the unit sphere and searched with a
+    KD-tree: straight-line (chord) distance orders points the same way as
+    great circle distance, and all queries cost O(n log m) instead of a
+    scan per query.
+
+    Args:
+        query_lat, query_lon (array-like): Query coordinates in degrees.
+        ref_lat, ref_lon (array-like): Reference coordinates in degrees
+            (no NaNs).
+        k (int): Neighbours per query (capped at the number of references).
+        radius_km (float): Neighbours further away than this are dropped.
+
+    Returns:
+        tuple: (distances_km, indices), both shaped (n_queries, k) and
+        sorted nearest first. Missing neighbours (outside the radius, or a
+        query with NaN coordinates) have distance NaN and index -1.
+    """
+    query = _unit_vectors(query_lat, query_lon)
+    ref = _unit_vectors(ref_lat, ref_lon)
+    k = min(k, len(ref))
+
+    distances = np.full((len(query), max(k, 1)), np.nan)
+    indices = np.full((len(query), max(k, 1)), -1)
+    valid = ~np.isnan(query).any(axis=1)
+    if k == 0 or not valid.any():
+        return distances, indices
+
+    # Chord length of the search radius; beyond it the tree returns inf
+    upper = np.inf
+    if radius_km is not None:
+        upper = 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2) * (1 + 1e-12)
+    from scipy.spatial import cKDTree  # deferred like the other heavy imports
+    chord, idx = cKDTree(ref).query(query[valid], k=k, distance_upper_bound=upper)
+    chord, idx = chord.reshape(-1, k), idx.reshape(-1, k)
+
+    found = np.isfinite(chord)
+    dist = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+    dist[~found] = np.nan
+    idx = np.where(found, idx, -1)
+    if radius_km is not None:
+        # Guard the boundary against chord/arc rounding
+        outside = dist > radius_km
+        dist[outside] = np.nan
+        idx[outside] = -1
+    distances[valid, :k] = dist
+    indices[valid, :k] = idx
+    return distances, indices
+
+
 def append_closest_location_info_bounded(
     stations_df, city_df,
     station_lat_col='lat', station_lon_col='lon',
     city_lat_col='lat', city_lon_col='lon',
     city_name_col='city',
-    search_radius_km=50
+    search_radius_km=50,
+    k=1
 ):
     """
-    Efficiently appends the closest city and distance to each station using bounding box + haversine.
+    Efficiently appends the closest city and distance to each station with
+    one nearest-neighbour query for all stations (see haversine_knn).
+
+    Cities further than search_radius_km give ClosestCity None and
+    CityDistance NaN. With k > 1 the next nearest cities are added as
+    ClosestCity_2/CityDistance_2 ... ClosestCity_k/CityDistance_k.
 
     # Run the function
         updated_df = append_closest_location_info_bounded(
@@ -275,44 +803,21 @@ def append_closest_location_info_bounded(
         search_radius_km=50  # You can increase this to 100+ if needed
         )
     """
-
-    results = []
-
-    for _, station in stations_df.iterrows():
-        lat1 = station[station_lat_col]
-        lon1 = station[station_lon_col]
-
-        # Bounding box filter
-        degree_margin = search_radius_km / 111  # Rough conversion km to degrees
-        lat_min, lat_max = lat1 - degree_margin, lat1 + degree_margin
-        lon_min, lon_max = lon1 - degree_margin, lon1 + degree_margin
-
-        nearby_cities = city_df[
-            (city_df[city_lat_col] >= lat_min) & (city_df[city_lat_col] <= lat_max) &
-            (city_df[city_lon_col] >= lon_min) & (city_df[city_lon_col] <= lon_max)
-        ]
-
-        if nearby_cities.empty:
-            results.append({
-                'ClosestCity': None,
-                'CityDistance': None
-            })
-            continue
-
-        distances = haversine_vectorized(
-            lat1, lon1,
-            nearby_cities[city_lat_col].values,
-            nearby_cities[city_lon_col].values
-        )
-
-        min_idx = np.argmin(distances)
-        closest_city = nearby_cities.iloc[min_idx][city_name_col]
-        closest_distance = distances[min_idx]
-
-        results.append({
-            'ClosestCity': closest_city,
-            'CityDistance': closest_distance
-        })
-
-    stations_df[['ClosestCity', 'CityDistance']] = pd.DataFrame(results)
-    return stations_df
\ No newline at end of file
+    city_df = city_df.dropna(subset=[city_lat_col, city_lon_col])
+    distances, indices = haversine_knn(
+        stations_df[station_lat_col].to_numpy(), stations_df[station_lon_col].to_numpy(),
+        city_df[city_lat_col].to_numpy(), city_df[city_lon_col].to_numpy(),
+        k=k, radius_km=search_radius_km
+    )
+
+    # Trailing None so index -1 (no city in range) maps to None
+    city_names = np.append(city_df[city_name_col].to_numpy(dtype=object), None)
+    for i in range(k):
+        suffix = f"_{i + 1}" if i else ""
+        if i < indices.shape[1]:
+            names, dist = city_names[indices[:, i]], distances[:, i]
+        else:
+            names, dist = np.full(len(stations_df), None), np.full(len(stations_df), np.nan)
+        stations_df[f'ClosestCity{suffix}'] = names
+        stations_df[f'CityDistance{suffix}'] = dist
+    return stations_df
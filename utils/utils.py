@@ -5,23 +5,30 @@ import zipfile
 import io
 import re
 import ast
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import tqdm
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from textblob import TextBlob
-import spacy
 
 # attach tqdm to pandas
-tqdm.pandas
+tqdm.tqdm.pandas()
 
-# Download necessary NLTK resources (if you haven't already)
-nltk.download('stopwords')
-nltk.download('wordnet')
+# NLTK corpora (download name -> nltk.data path) and spaCy model, loaded on
+# first use rather than at import: importing nltk, textblob and spaCy and
+# loading the model cost seconds, and downloading needs the network.
+NLTK_RESOURCES = {'stopwords': 'corpora/stopwords', 'wordnet': 'corpora/wordnet'}
+SPACY_MODEL = "en_core_web_sm"
+_nltk_ready = False
+_nlp = None
+_resource_lock = threading.Lock()
 
-# Load the spaCy model
-nlp = spacy.load("en_core_web_sm")
+# clean_text patterns, compiled once
+HTML_TAG_PATTERN = re.compile(r'<.*?>')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+# Distinct words whose lemma is memoized (per process)
+LEMMA_CACHE_SIZE = 200_000
 
 
 @log_function_call(logger)
@@ -48,29 +55,55 @@ def checkdirectory():
             print("Current Directory =", current_dir)
 
 
+# Output formats of save_dataframe_to_zip
+SAVE_FORMATS = ("csv", "parquet", "feather")
+# Rows serialized at a time when streaming CSV into the zip
+ZIP_CSV_CHUNKSIZE = 100_000
+
+
 @log_function_call(logger)
-def save_dataframe_to_zip(df, zip_filename, csv_filename='data.csv'):
-    logger.info(f"Saving Df to {zip_filename}")
-    """Saves a pandas DataFrame to a zipped CSV file.
+def save_dataframe_to_zip(df, zip_filename, csv_filename='data.csv', file_format="csv",
+                          chunksize=ZIP_CSV_CHUNKSIZE):
+    """Saves a pandas DataFrame to a zipped CSV file, or to Parquet/Feather.
+
+    The CSV is streamed into the zip entry chunk by chunk, so neither a
+    temporary file nor a full in-memory copy of the CSV is made.
 
     Args:
         df: The pandas DataFrame to save.
-        zip_filename: The name of the zip file to create.
+        zip_filename: The name of the zip file to create; in parquet and
+            feather mode the extension is replaced by the format's.
         csv_filename: The name of the CSV file inside the zip archive.
+        file_format (str): One of SAVE_FORMATS.
+        chunksize (int): Rows written to the zip entry at a time.
+
+    Returns:
+        str: Path of the written file.
     """
-    # save the dataframe to a csv file
-    df.to_csv(csv_filename, index=False)
-    # Create an in-memory buffer for the CSV data
-    csv_buffer = io.StringIO()
-    # Save the DataFrame to the buffer as a CSV
-    df.to_csv(csv_buffer,
-              index=True,
-              index_label="index",
-              quoting=csv.QUOTE_NONNUMERIC
-              )  # index=False to exclude the index
-    # Create a zip file and add the CSV data to it
+    if file_format not in SAVE_FORMATS:
+        raise ValueError(f"file_format must be one of {SAVE_FORMATS}, got {file_format!r}")
+    if file_format != "csv":
+        path = os.path.splitext(zip_filename)[0] + "." + file_format
+        logger.info(f"Saving Df to {path}")
+        if file_format == "parquet":
+            df.to_parquet(path)
+        else:
+            # Feather only stores a default index; keep it as the 'index' column
+            df.reset_index().to_feather(path)
+        return path
+
+    logger.info(f"Saving Df to {zip_filename}")
     with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        zip_file.writestr(csv_filename, csv_buffer.getvalue())
+        with zip_file.open(csv_filename, 'w', force_zip64=True) as entry, \
+                io.TextIOWrapper(entry, encoding='utf-8', newline='') as csv_stream:
+            for start in range(0, max(len(df), 1), chunksize):
+                df.iloc[start:start + chunksize].to_csv(csv_stream,
+                                                        header=start == 0,
+                                                        index=True,
+                                                        index_label="index",
+                                                        quoting=csv.QUOTE_NONNUMERIC
+                                                        )
+    return zip_filename
 
 
 @log_function_call(logger)
@@ -83,38 +116,111 @@ def separate_string(input_string):
     return remaining_text, bracket_content
 
 
-@log_function_call(logger)
-def clean_text(text):
-    """Cleans the input text."""
+def ensure_nltk_resources():
+    """Downloads the NLTK corpora in NLTK_RESOURCES that are not installed
+    yet; installed ones are found locally without touching the network."""
+    global _nltk_ready
+    with _resource_lock:
+        if _nltk_ready:
+            return
+        import nltk
+        for name, path in NLTK_RESOURCES.items():
+            try:
+                nltk.data.find(path)
+            except LookupError:
+                logger.info(f"Downloading NLTK resource {name}")
+                nltk.download(name, quiet=True)
+        _nltk_ready = True
+
+
+def get_nlp():
+    """The shared spaCy pipeline (SPACY_MODEL), loaded on first use."""
+    global _nlp
+    with _resource_lock:
+        if _nlp is None:
+            import spacy
+            _nlp = spacy.load(SPACY_MODEL)
+        return _nlp
+
+
+def __getattr__(name):
+    # Keep utils.utils.nlp working for existing callers
+    if name == "nlp":
+        return get_nlp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def _text_cleaner():
+    """Stop words and a memoized lemmatizer, built once per process."""
+    ensure_nltk_resources()
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    stop_words = frozenset(stopwords.words('english'))
+    lemmatize = functools.lru_cache(maxsize=LEMMA_CACHE_SIZE)(WordNetLemmatizer().lemmatize)
+    return stop_words, lemmatize
+
+
+def _clean_one(text, stop_words, lemmatize):
     # check that passed text is a string
     if not isinstance(text, str):
         return ""  # Return empty string for non-string input
     # Remove HTML tags (if any)
-    text = re.sub(r'<.*?>', '', text)
+    text = HTML_TAG_PATTERN.sub('', text)
     # Remove special characters and punctuation
-    text = re.sub(r'[^\w\s]', '', text)
-    # Convert to lowercase
-    text = text.lower()
-    # Tokenization and stop word removal
-    words = text.split()
-    stop_words = set(stopwords.words('english'))
-    words = [word for word in words if word not in stop_words]
-    # Lemmatization
-    lemmatizer = WordNetLemmatizer()
-    words = [lemmatizer.lemmatize(word) for word in words]
-    # Rejoin the cleaned words
-    cleaned_text = ' '.join(words)
-    # return the cleaned text
-    return cleaned_text
+    text = PUNCTUATION_PATTERN.sub('', text)
+    # Convert to lowercase, tokenize, remove stop words and lemmatize
+    return ' '.join(lemmatize(word) for word in text.lower().split()
+                    if word not in stop_words)
+
+
+@log_function_call(logger)
+def clean_text(text):
+    """Cleans the input text."""
+    return _clean_one(text, *_text_cleaner())
+
+
+def _clean_chunk(texts):
+    stop_words, lemmatize = _text_cleaner()
+    return [_clean_one(text, stop_words, lemmatize) for text in texts]
+
+
+@log_function_call(logger)
+def clean_texts(texts, n_workers=1, chunksize=10_000):
+    """
+    Cleans many texts with the same output as clean_text, building the
+    stop words and lemmatizer once and memoizing lemmas.
+
+    df['clean_text'] = clean_texts(df['text'], n_workers=4)
+
+    Args:
+        texts: pandas Series or iterable of texts.
+        n_workers (int): Processes to spread the texts over; 1 cleans in
+            this process.
+        chunksize (int): Texts per task in pool mode.
+
+    Returns:
+        Series (same index) if texts is a Series, otherwise a list.
+    """
+    index = texts.index if isinstance(texts, pd.Series) else None
+    texts = list(texts)
+    if n_workers > 1 and len(texts) > chunksize:
+        chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            cleaned = [text for chunk in executor.map(_clean_chunk, chunks) for text in chunk]
+    else:
+        cleaned = _clean_chunk(texts)
+    return pd.Series(cleaned, index=index, dtype=object) if index is not None else cleaned
 
 
 # Sentiment analysis on the cleaned text:
 def get_sentiment(text):
     # check that passed text is a string
     if isinstance(text, str):
-        # turn into a TextBlob object
-        blob = TextBlob(text)
-        return blob.sentiment.polarity, blob.sentiment.subjectivity
+        from textblob import TextBlob
+        # turn into a TextBlob object and score it once
+        sentiment = TextBlob(text).sentiment
+        return sentiment.polarity, sentiment.subjectivity
     else:
         return None, None
 
@@ -142,6 +248,69 @@ def categorize_subjectivity(subjectivity):
         return 'higly objective'
 
 
+def categorize_polarities(polarity):
+    """Vectorized categorize_polarity over a Series or array."""
+    polarity = np.asarray(polarity, dtype=float)
+    return np.select([polarity > 0, polarity < 0], ['positive', 'negative'],
+                     default='neutral').astype(object)
+
+
+def categorize_subjectivities(subjectivity):
+    """Vectorized categorize_subjectivity over a Series or array; missing
+    scores fall in the lowest band, as in the scalar version."""
+    categories = pd.cut(np.asarray(subjectivity, dtype=float),
+                        bins=[-np.inf, 0.2, 0.4, 0.6, 0.8, np.inf],
+                        labels=['higly objective', 'objective', 'neutral',
+                                'subjective', 'highly subjective'])
+    return np.asarray(pd.Series(categories).astype(object).fillna('higly objective'))
+
+
+def _sentiment_chunk(texts):
+    return [get_sentiment(text) for text in texts]
+
+
+@log_function_call(logger)
+def score_sentiments(texts, n_workers=1, chunksize=5_000):
+    """
+    Bulk sentiment stage: scores every distinct text once with TextBlob
+    (identical texts, common in reposts, are deduplicated by hashing their
+    content), optionally across a process pool, and adds the polarity and
+    subjectivity categories vectorized.
+
+    df[['polarity', 'subjectivity', 'polarity_category',
+        'subjectivity_category']] = score_sentiments(df['clean_text'], n_workers=4)
+
+    Args:
+        texts: pandas Series or iterable of texts.
+        n_workers (int): Processes to score with; 1 scores in this process.
+        chunksize (int): Distinct texts per task in pool mode.
+
+    Returns:
+        DataFrame: polarity, subjectivity (NaN for non-strings),
+        polarity_category and subjectivity_category, indexed like texts.
+    """
+    index = texts.index if isinstance(texts, pd.Series) else None
+    texts = pd.Series(list(texts), dtype=object)
+    is_text = texts.map(lambda text: isinstance(text, str))
+    codes, unique_texts = pd.factorize(texts.where(is_text))
+
+    unique_texts = list(unique_texts)
+    if n_workers > 1 and len(unique_texts) > chunksize:
+        chunks = [unique_texts[i:i + chunksize] for i in range(0, len(unique_texts), chunksize)]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            scores = [score for chunk in executor.map(_sentiment_chunk, chunks) for score in chunk]
+    else:
+        scores = _sentiment_chunk(unique_texts)
+    # Extra NaN row so code -1 (non-string input) maps to missing scores
+    scores = np.array(scores + [(np.nan, np.nan)], dtype=float).reshape(-1, 2)[codes]
+
+    result = pd.DataFrame({'polarity': scores[:, 0], 'subjectivity': scores[:, 1]},
+                          index=index)
+    result['polarity_category'] = categorize_polarities(result['polarity'])
+    result['subjectivity_category'] = categorize_subjectivities(result['subjectivity'])
+    return result
+
+
 # covert a string to a list
 def string_to_list(location_str):
     """Safely converts a string representation of a list to a list."""
@@ -151,26 +320,73 @@ def string_to_list(location_str):
         return []
 
 
-# define media types
-def classify_media(text):
-    media_dict = {'video': ['video', 'watch', 'live',
+# define media types, in priority order (the first type that matches wins)
+MEDIA_KEYWORDS = {'video': ['video', 'watch', 'live',
                             'stream', 'youtube',
                             'vimeo', 'twitch'],
                   'audio': ['audio', 'listen', 'podcast', 'radio'],
                   'image': ['image', 'photo', 'picture', 'gif'],
                   'infographic': ['infographic'],
                   'poll': ['poll'],
-                  'twitter': ['twitter', 'X', 'x', 'tweet', 'retweeted'],
+                  'twitter': ['twitter', 'x', 'tweet', 'retweeted'],
                   'facebook': ['facebook', 'fb', 'like', 'share', 'comment'],
                   'instagram': ['instagram', 'ig', ],
                   'linkedin': ['linkedin', 'share'],
                   }
+MEDIA_TYPES = list(MEDIA_KEYWORDS)
+
+
+def _keyword_pattern(words):
+    # Whole words only (plural 's' allowed), so 'x' no longer matches 'next'
+    return r'\b(?:' + '|'.join(map(re.escape, words)) + r')s?\b'
+
+
+# One alternation with a named group per media type, compiled once
+MEDIA_PATTERN = re.compile('|'.join(f'(?P<{key}>{_keyword_pattern(words)})'
+                                    for key, words in MEDIA_KEYWORDS.items()),
+                           re.IGNORECASE)
+# Per-type patterns for the vectorized Series path
+MEDIA_TYPE_PATTERNS = {key: re.compile(_keyword_pattern(words), re.IGNORECASE)
+                       for key, words in MEDIA_KEYWORDS.items()}
+
+
+def classify_media(text):
+    """Media type of a text: the highest-priority type in MEDIA_KEYWORDS
+    with a whole-word match, or 'text'."""
     # Handle NaN cases safely
-    if pd.isna(text):
-        return 'text'
-    for key, value in media_dict.items():
-        # Lowercase to ensure case insensitivity
-        if any(word in text.lower() for word in value):
-            return key
+    if not isinstance(text, str):
+        return 'text' if pd.isna(text) else classify_media(str(text))
+    best = len(MEDIA_TYPES)
+    for match in MEDIA_PATTERN.finditer(text):
+        # The alternation is in priority order, so a match's group index
+        # is its media type's priority
+        best = min(best, match.lastindex - 1)
+        if best == 0:
+            break
     # Default to 'text' if no media type is found
-    return 'text'
+    return MEDIA_TYPES[best] if best < len(MEDIA_TYPES) else 'text'
+
+
+@log_function_call(logger)
+def classify_media_series(texts):
+    """
+    Vectorized classify_media: each distinct text is scanned once per media
+    type with the compiled patterns and the highest-priority match is picked
+    with np.select.
+
+    df['media_type'] = classify_media_series(df['text'])
+
+    Args:
+        texts: pandas Series or iterable of texts.
+
+    Returns:
+        Series of media types, indexed like texts.
+    """
+    texts = texts if isinstance(texts, pd.Series) else pd.Series(list(texts), dtype=object)
+    codes, unique_texts = pd.factorize(texts)
+    unique_texts = pd.Series(unique_texts, dtype=object).astype(str)
+    matches = [unique_texts.str.contains(pattern).to_numpy()
+               for pattern in MEDIA_TYPE_PATTERNS.values()]
+    media = np.select(matches, MEDIA_TYPES, default='text').astype(object)
+    # Extra 'text' entry so code -1 (missing input) maps to the default
+    return pd.Series(np.append(media, 'text')[codes], index=texts.index, dtype=object)
@@ -1,10 +1,68 @@
 import os
 import json
+import hashlib
 import logging
+import numpy as np
 import pandas as pd
-from typing import List
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import List, Optional
+from pandas.api.types import union_categoricals
 from tqdm import tqdm
 
+GHCN_COLUMNS = ["Station_ID", "Date", "Element", "DataValue"]
+READERS = ("pandas", "arrow")
+# Arrow reads the first four GHCN columns under generated names, with the
+# two string keys dictionary-encoded so filtering works on codes
+ARROW_GHCN_TYPES = {
+    "f0": pa.dictionary(pa.int32(), pa.string()),
+    "f1": pa.int64(),
+    "f2": pa.dictionary(pa.int32(), pa.string()),
+    "f3": pa.int64(),
+}
+# Typical GHCN-Daily line length, to turn a row chunksize into an Arrow block size
+GHCN_ROW_BYTES = 32
+# Run manifest kept in output_dir, recording what each output was built from
+MANIFEST_FILENAME = "weather_manifest.json"
+# Parquet output: one hive partition per year under output_dir
+WEATHER_PARQUET_DIR = "Us_Weather_Parquet"
+# Rows are sorted by (Station_ID, Date), so each row group spans a narrow
+# station range and its min/max statistics let the station join skip it
+# (Station_ID is a plain string column for this: Arrow does not prune row
+# groups on dictionary columns; Parquet still dictionary-encodes it on disk)
+PARQUET_ROW_GROUP_SIZE = 250_000
+OUTPUT_FORMATS = ("csv", "parquet")
+GROUP_KEYS = ["Station_ID", "Date", "Element"]
+
+# Aggregators that element_config.json may assign to an element, mapped to
+# the partial statistics each one is computed from
+AGGREGATORS = {
+    "mean": ["sum", "count"],
+    "max": ["max"],
+    "min": ["min"],
+    "sum": ["sum"],
+    "count": ["count"],
+    "first": ["first"],
+    "last": ["last"],
+}
+# How each partial statistic is folded when two chunks are merged; first and
+# last rely on the running aggregates being concatenated ahead of the chunk
+PARTIAL_FOLDS = {"sum": "sum", "count": "sum", "max": "max", "min": "min",
+                 "first": "first", "last": "last"}
+# Group reductions over values sorted by group, given group start/end offsets
+REDUCERS = {
+    "sum": lambda values, starts, ends: np.add.reduceat(values, starts),
+    "count": lambda values, starts, ends: (ends - starts).astype(np.float64),
+    "max": lambda values, starts, ends: np.fmax.reduceat(values, starts),
+    "min": lambda values, starts, ends: np.fmin.reduceat(values, starts),
+    "first": lambda values, starts, ends: values[starts],
+    "last": lambda values, starts, ends: values[ends - 1],
+}
+
 # Set up logging to both console and file
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +77,488 @@ def load_element_config(config_path: str) -> dict:
     with open(config_path, "r") as f:
         return json.load(f)
 
+def _limit_worker_memory(max_memory_mb: Optional[int]) -> None:
+    """Caps the address space of a pool worker so one runaway year fails
+    with MemoryError instead of taking the whole box down."""
+    if not max_memory_mb:
+        return
+    try:
+        import resource
+    except ImportError:
+        logging.warning("Per-worker memory limits are not supported on this platform")
+        return
+    limit = max_memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _filter_weather_rows(
+    weather_df: pd.DataFrame,
+    station_ids: set,
+    element_list: List[str]
+) -> pd.DataFrame:
+    """Keeps US stations from the station list, configured elements and
+    drops the 9999 missing value marker."""
+    return weather_df[
+        (weather_df["Station_ID"].str[:2] == "US") &
+        (weather_df["Station_ID"].isin(station_ids)) &
+        (weather_df["Element"].isin(element_list)) &
+        (weather_df["DataValue"] != 9999)
+    ]
+
+def _dictionary_isin(column: pa.ChunkedArray, keep) -> pa.ChunkedArray:
+    """Row mask of a dictionary column whose value satisfies keep. keep is
+    evaluated once per dictionary entry and the result gathered by index,
+    so no per-row string comparison happens."""
+    return pa.chunked_array(
+        [pc.take(keep(chunk.dictionary), chunk.indices) for chunk in column.chunks],
+        type=pa.bool_()
+    )
+
+def _filter_weather_table(
+    table: pa.Table,
+    station_ids: set,
+    element_list: List[str]
+) -> pd.DataFrame:
+    """Arrow counterpart of _filter_weather_rows for tables read with
+    ARROW_GHCN_TYPES. Returns the kept rows as a pandas frame with
+    categorical Station_ID and Element."""
+    table = table.rename_columns(GHCN_COLUMNS)
+    # Missing (NaN/None) IDs match nothing, as with pandas isin
+    station_set = pa.array(sorted(s for s in station_ids if isinstance(s, str)),
+                           type=pa.string())
+    element_set = pa.array(element_list, type=pa.string())
+    mask = pc.and_(
+        pc.and_(
+            _dictionary_isin(table["Station_ID"], lambda values: pc.and_(
+                pc.starts_with(values, "US"), pc.is_in(values, value_set=station_set))),
+            _dictionary_isin(table["Element"],
+                             lambda values: pc.is_in(values, value_set=element_set))
+        ),
+        pc.not_equal(table["DataValue"], 9999)
+    )
+    weather_df = table.filter(mask).to_pandas()
+    # Keep only observed values, in lexical order, so factorizing the
+    # categoricals sorts the same way as factorizing strings
+    for key in ("Station_ID", "Element"):
+        categories = weather_df[key].cat.remove_unused_categories()
+        weather_df[key] = categories.cat.reorder_categories(sorted(categories.cat.categories))
+    return weather_df
+
+def _read_weather_chunks(
+    filepath: str,
+    station_ids: set,
+    element_list: List[str],
+    chunksize: Optional[int],
+    reader: str
+):
+    """Yields (rows read, filtered rows) for a yearly file, as one chunk or
+    in chunks of about chunksize rows, using the pandas or Arrow parser."""
+    if reader == "arrow":
+        read_options = pacsv.ReadOptions(
+            autogenerate_column_names=True,
+            use_threads=True,
+            block_size=chunksize * GHCN_ROW_BYTES if chunksize else None
+        )
+        convert_options = pacsv.ConvertOptions(
+            include_columns=list(ARROW_GHCN_TYPES),
+            column_types=ARROW_GHCN_TYPES
+        )
+        if not chunksize:
+            table = pacsv.read_csv(filepath, read_options=read_options,
+                                   convert_options=convert_options)
+            yield table.num_rows, _filter_weather_table(table, station_ids, element_list)
+            return
+        for batch in pacsv.open_csv(filepath, read_options=read_options,
+                                    convert_options=convert_options):
+            table = pa.Table.from_batches([batch])
+            yield table.num_rows, _filter_weather_table(table, station_ids, element_list)
+        return
+
+    chunks = pd.read_csv(
+        filepath,
+        header=None,
+        usecols=[0, 1, 2, 3],
+        names=GHCN_COLUMNS,
+        chunksize=chunksize
+    )
+    for chunk in (chunks if chunksize else [chunks]):
+        yield len(chunk), _filter_weather_rows(chunk, station_ids, element_list)
+
+def _required_partials(element_agg_map: dict) -> List[str]:
+    """Partial statistics needed for the aggregators used in the config."""
+    unknown = set(element_agg_map.values()) - set(AGGREGATORS)
+    if unknown:
+        raise ValueError(f"Unsupported aggregations in element config: {unknown}. "
+                         f"Supported: {list(AGGREGATORS)}")
+    used = set(element_agg_map.values())
+    return [stat for stat in PARTIAL_FOLDS
+            if any(stat in AGGREGATORS[agg] for agg in used)]
+
+def _group_reduce(df: pd.DataFrame, reductions: dict) -> pd.DataFrame:
+    """
+    Groups df by (Station_ID, Date, Element) and applies every reduction in
+    one pass. reductions maps output column -> (input column, REDUCERS key).
+
+    The keys are factorized into a single int64 cell code, rows are put in
+    cell order with one sort (stable when first/last are requested) and
+    each reduction is a ufunc.reduceat over the group offsets. The result
+    is sorted by the group keys, which are returned as categoricals so
+    later steps reuse the codes.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=GROUP_KEYS + list(reductions))
+
+    codes, uniques = zip(*(pd.factorize(df[key], sort=True) for key in GROUP_KEYS))
+    n_dates, n_elements = len(uniques[1]), len(uniques[2])
+    cell = ((codes[0].astype(np.int64) * n_dates + codes[1]) * n_elements + codes[2])
+
+    # first/last need input order within a group; otherwise any sort will do
+    order_matters = any(reducer in ("first", "last") for _, reducer in reductions.values())
+    order = np.argsort(cell, kind="stable" if order_matters else "quicksort")
+    cell = cell[order]
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    ends = np.r_[starts[1:], len(cell)]
+    group_cell = cell[starts]
+
+    group_codes = [
+        group_cell // (n_dates * n_elements),
+        group_cell // n_elements % n_dates,
+        group_cell % n_elements,
+    ]
+    result = {
+        key: pd.Categorical.from_codes(key_codes, categories=key_uniques)
+        for key, key_codes, key_uniques in zip(GROUP_KEYS, group_codes, uniques)
+    }
+    for out_col, (in_col, reducer) in reductions.items():
+        values = df[in_col].to_numpy(dtype=np.float64)[order]
+        result[out_col] = REDUCERS[reducer](values, starts, ends)
+    return pd.DataFrame(result)
+
+def _partial_aggregates(weather_df: pd.DataFrame, partials: List[str]) -> pd.DataFrame:
+    """Computes every requested statistic of DataValue per
+    (Station_ID, Date, Element) in a single grouped pass."""
+    return _group_reduce(weather_df, {stat: ("DataValue", stat) for stat in partials})
+
+def _fold_partials(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """Merges partial aggregates (the running aggregates first, then chunk
+    partials in file order) in one grouped pass. The keys are combined with
+    union_categoricals, so they stay categorical over the union of the
+    categories instead of falling back to object."""
+    if len(parts) == 1:
+        return parts[0]
+    stats = [col for col in parts[0].columns if col not in GROUP_KEYS]
+    combined = {
+        key: union_categoricals([part[key] for part in parts], sort_categories=True)
+        for key in GROUP_KEYS
+    }
+    for stat in stats:
+        combined[stat] = np.concatenate([part[stat].to_numpy() for part in parts])
+    return _group_reduce(pd.DataFrame(combined),
+                         {stat: (stat, PARTIAL_FOLDS[stat]) for stat in stats})
+
+def _finalize_partials(partials: pd.DataFrame, element_agg_map: dict) -> pd.DataFrame:
+    """Turns partial aggregates into the wide per-station-day frame,
+    picking each element's aggregation from the config. Columns are
+    grouped by aggregator in AGGREGATORS order (mean, max, min, ...) and
+    sorted within each group, as the old per-aggfunc pivot chain did."""
+    # partials come from _group_reduce: sorted, with categorical group keys
+    stations, dates, elements = (partials[key].cat for key in GROUP_KEYS)
+    element_codes = elements.codes.to_numpy()
+    agg_type = np.array([element_agg_map[e] for e in elements.categories])[element_codes]
+
+    values = np.full(len(partials), np.nan)
+    for agg_func in set(element_agg_map.values()):
+        mask = agg_type == agg_func
+        if agg_func == "mean":
+            values[mask] = partials["sum"].to_numpy()[mask] / partials["count"].to_numpy()[mask]
+        else:
+            values[mask] = partials[agg_func].to_numpy()[mask]
+
+    # Scatter the long values into a (station-day x element) grid
+    n_dates = len(dates.categories)
+    row_key = stations.codes.to_numpy().astype(np.int64) * n_dates + dates.codes.to_numpy()
+    new_row = np.r_[True, row_key[1:] != row_key[:-1]]  # row_key is already sorted
+    row_codes = np.cumsum(new_row) - 1
+    row_keys = row_key[new_row]
+    grid = np.full((len(row_keys), len(elements.categories)), np.nan)
+    grid[row_codes, element_codes] = values
+
+    wide = pd.DataFrame(grid, columns=np.asarray(elements.categories, dtype=object), copy=False)
+    wide.insert(0, "Date", np.asarray(dates.categories)[row_keys % n_dates])
+    wide.insert(0, "Station_ID", np.asarray(stations.categories, dtype=object)[row_keys // n_dates])
+
+    return wide[["Station_ID", "Date"] + _element_order(element_agg_map, set(wide.columns))]
+
+def _element_order(element_agg_map: dict, present: Optional[set] = None) -> List[str]:
+    """Element columns grouped by aggregator in AGGREGATORS order and sorted
+    within each group, optionally limited to the present ones."""
+    return [
+        element
+        for agg_func in AGGREGATORS
+        for element in sorted(e for e, a in element_agg_map.items() if a == agg_func)
+        if present is None or element in present
+    ]
+
+def aggregate_weather(weather_df: pd.DataFrame, element_agg_map: dict) -> pd.DataFrame:
+    """
+    Aggregates filtered GHCN rows into one row per (Station_ID, Date) with
+    a column per element, using the aggregator the config assigns to each
+    element (mean, max, min, sum, count, first or last).
+
+    All elements are aggregated in one grouped pass (one sort of integer
+    group codes) and scattered into the wide frame once, instead of a
+    masked pivot_table per aggregator.
+    """
+    partials = _partial_aggregates(weather_df, _required_partials(element_agg_map))
+    if partials.empty:
+        # Nothing kept: same empty frame as the streaming path
+        return pd.DataFrame(columns=["Station_ID", "Date"])
+    return _finalize_partials(partials, element_agg_map)
+
+def _stream_weather_file(
+    filepath: str,
+    element_agg_map: dict,
+    station_ids: set,
+    chunksize: int,
+    reader: str = "pandas"
+) -> pd.DataFrame:
+    """Reads a yearly file chunk by chunk, folding each filtered chunk into
+    running aggregates. Peak memory follows the number of distinct
+    station-days kept, not the size of the file."""
+    element_list = list(element_agg_map.keys())
+    stats = _required_partials(element_agg_map)
+
+    # Chunk partials are buffered and folded in once they add up to the
+    # running aggregates' size, so each station-day is re-reduced a
+    # logarithmic number of times instead of once per chunk, and memory
+    # stays within about twice the running aggregates
+    partials = None
+    buffered, buffered_rows = [], 0
+    rows_read = 0
+    for n_rows, chunk in _read_weather_chunks(filepath, station_ids, element_list,
+                                              chunksize, reader):
+        rows_read += n_rows
+        if chunk.empty:
+            continue
+        part = _partial_aggregates(chunk, stats)
+        buffered.append(part)
+        buffered_rows += len(part)
+        if partials is None or buffered_rows >= len(partials):
+            partials = _fold_partials(([] if partials is None else [partials]) + buffered)
+            buffered, buffered_rows = [], 0
+    if buffered:
+        partials = _fold_partials([partials] + buffered)
+
+    logging.info(f"Streamed {rows_read} rows, "
+                 f"{0 if partials is None else len(partials)} station-day elements kept")
+    if partials is None:
+        return pd.DataFrame(columns=["Station_ID", "Date"])
+    return _finalize_partials(partials, element_agg_map)
+
+def process_weather_file(
+    file: str,
+    element_agg_map: dict,
+    station_ids: set,
+    input_dir: str = "Not_to_be_shared_to_repo",
+    chunksize: Optional[int] = None,
+    reader: str = "pandas"
+) -> pd.DataFrame:
+    """Reads one GHCN-Daily yearly file and returns one row per
+    (Station_ID, Date) with a column per element. With chunksize set the
+    file is streamed in chunks of that many rows. reader="arrow" parses
+    with the multi-threaded pyarrow.csv reader and filters on dictionary
+    codes instead of Python strings."""
+    if reader not in READERS:
+        raise ValueError(f"Unsupported reader: {reader}. Supported: {list(READERS)}")
+    element_list = list(element_agg_map.keys())
+    filepath = os.path.join(input_dir, file)
+    logging.info(f"Reading file: {filepath}")
+
+    if chunksize:
+        final_df = _stream_weather_file(filepath, element_agg_map, station_ids,
+                                        chunksize, reader)
+        logging.info(f"Final shape: {final_df.shape}")
+        return final_df
+
+    (rows_read, weather_df), = _read_weather_chunks(filepath, station_ids, element_list,
+                                                    None, reader)
+    logging.info(f"Initial rows: {rows_read}")
+    logging.info(f"Filtered shape: {weather_df.shape}")
+
+    final_df = aggregate_weather(weather_df, element_agg_map)
+    logging.info(f"Final shape: {final_df.shape}")
+    return final_df
+
+def weather_schema(element_agg_map: dict) -> pa.Schema:
+    """Parquet schema of the weather output: a string Station_ID, a date32
+    Date and a float64 column for every configured element, so all years
+    share one schema whichever elements they happen to contain."""
+    return pa.schema(
+        [pa.field("Station_ID", pa.string()),
+         pa.field("Date", pa.date32())]
+        + [pa.field(element, pa.float64()) for element in _element_order(element_agg_map)]
+    )
+
+def _to_weather_table(final_df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Converts a processed year to an Arrow table with the given schema;
+    elements absent from the year become all-null columns."""
+    n_rows = len(final_df)
+    arrays = [
+        pa.array(final_df["Station_ID"].astype(str), type=pa.string()),
+        pa.array(pd.to_datetime(final_df["Date"].astype(str), format="%Y%m%d").dt.date,
+                 type=pa.date32()),
+    ]
+    for field in list(schema)[2:]:
+        if field.name in final_df:
+            arrays.append(pa.array(final_df[field.name], type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.nulls(n_rows, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def _output_path(file: str, output_dir: str, output_format: str) -> str:
+    if output_format == "parquet":
+        year = file.split(".")[0]
+        return os.path.join(output_dir, WEATHER_PARQUET_DIR, f"Year={year}", "part-0.parquet")
+    return os.path.join(output_dir, f"Us_{file}_Weather_Unpacked.zip")
+
+def _tmp_path(path: str) -> str:
+    """Temporary sibling of path; the leading underscore keeps it out of
+    pyarrow dataset discovery."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f"_{name}.tmp")
+
+def _process_and_save(
+    file: str,
+    element_agg_map: dict,
+    station_ids: set,
+    input_dir: str,
+    output_dir: str,
+    chunksize: Optional[int],
+    output_format: str = "csv",
+    reader: str = "pandas"
+) -> str:
+    """Processes one file and writes its per-year output, which doubles as
+    the checkpoint for resumed and combined runs. The output is written
+    under a temporary name and renamed, so an interrupted write never
+    looks complete. Returns the output path."""
+    final_df = process_weather_file(file, element_agg_map, station_ids, input_dir,
+                                    chunksize, reader)
+
+    output_path = _output_path(file, output_dir, output_format)
+    tmp_path = _tmp_path(output_path)
+    if output_format == "parquet":
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        table = _to_weather_table(final_df, weather_schema(element_agg_map))
+        pq.write_table(table, tmp_path, row_group_size=PARQUET_ROW_GROUP_SIZE,
+                       compression="snappy")
+    else:
+        archive_name = os.path.basename(output_path)[:-len(".zip")]
+        final_df.to_csv(tmp_path, index=False,
+                        compression={"method": "zip", "archive_name": archive_name})
+    os.replace(tmp_path, output_path)
+    logging.info(f"Saved output to: {output_path}")
+    return output_path
+
+def _file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _config_hash(element_agg_map: dict, station_ids: set, output_format: str) -> str:
+    """Hash of everything besides the input file that shapes an output."""
+    config = {"elements": element_agg_map, "stations": sorted(station_ids),
+              "format": output_format}
+    if output_format == "parquet":
+        # Rewrite Parquet outputs whose schema is out of date
+        config["schema"] = weather_schema(element_agg_map).to_string()
+    payload = json.dumps(config, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _input_signature(filepath: str, previous: Optional[dict]) -> dict:
+    """Size, mtime and sha256 of an input. The recorded hash is reused when
+    size and mtime are unchanged, so unchanged multi-GB inputs are not
+    re-read; a touched but identical file is caught by the hash."""
+    stat = os.stat(filepath)
+    signature = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if (previous
+            and previous.get("size") == signature["size"]
+            and previous.get("mtime") == signature["mtime"]):
+        signature["sha256"] = previous["sha256"]
+    else:
+        signature["sha256"] = _file_sha256(filepath)
+    return signature
+
+def load_manifest(output_dir: str) -> dict:
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {"files": {}, "combined": None}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def _save_manifest(manifest: dict, output_dir: str) -> None:
+    """Writes the manifest atomically so a crash never leaves it corrupt."""
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _is_current(entry: Optional[dict], signature: dict, config_hash: str) -> bool:
+    return bool(
+        entry
+        and entry.get("sha256") == signature["sha256"]
+        and entry.get("config_hash") == config_hash
+        and os.path.exists(entry.get("output", ""))
+    )
+
+def _record_output(manifest: dict, file: str, signature: dict,
+                   config_hash: str, output_path: str, output_dir: str) -> None:
+    """Checkpoints one finished file in the manifest."""
+    manifest["files"][file] = {
+        **signature,
+        "config_hash": config_hash,
+        "output": output_path,
+        "completed_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    _save_manifest(manifest, output_dir)
+
+def _write_combined(file_list: List[str], manifest: dict, output_path: str) -> None:
+    """Builds the combined CSV output from the per-year checkpoints, in
+    file_list order."""
+    combined_dfs = []
+    for file in file_list:
+        year_df = pd.read_csv(manifest["files"][file]["output"])
+        year_df["SourceFile"] = file  # Optional traceability
+        combined_dfs.append(year_df)
+    final_combined_df = pd.concat(combined_dfs, axis=0, ignore_index=True)
+    tmp_path = _tmp_path(output_path)
+    final_combined_df.to_csv(tmp_path, index=False, compression={
+        "method": "zip", "archive_name": os.path.basename(output_path)[:-len(".zip")]})
+    os.replace(tmp_path, output_path)
+    logging.info(f"Saved combined output to: {output_path}")
+
+def _write_combined_parquet(
+    file_list: List[str],
+    manifest: dict,
+    output_path: str,
+    schema: pa.Schema
+) -> None:
+    """Builds the combined Parquet output by appending the per-year row
+    groups in file_list order, so only one row group is in memory."""
+    schema = schema.append(pa.field("SourceFile", pa.dictionary(pa.int32(), pa.string())))
+    tmp_path = _tmp_path(output_path)
+    with pq.ParquetWriter(tmp_path, schema, compression="snappy") as writer:
+        for file in file_list:
+            year_file = pq.ParquetFile(manifest["files"][file]["output"])
+            for i in range(year_file.num_row_groups):
+                row_group = year_file.read_row_group(i)
+                source = pa.DictionaryArray.from_arrays(
+                    pa.array(np.zeros(row_group.num_rows, dtype=np.int32)), pa.array([file]))
+                writer.write_table(row_group.append_column(schema.field("SourceFile"), source))
+    os.replace(tmp_path, output_path)
+    logging.info(f"Saved combined output to: {output_path}")
+
 def process_weather_files(
     file_list: List[str],
     config_path: str,
@@ -26,63 +566,146 @@ def process_weather_files(
     station_fieldname: str,
     output_dir: str,
     combine_output: bool = False,
-    combined_filename: str = "All_Weather_Unpacked.zip"
+    combined_filename: str = "All_Weather_Unpacked.zip",
+    input_dir: str = "Not_to_be_shared_to_repo",
+    n_workers: int = 1,
+    max_worker_memory_mb: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    force: bool = False,
+    output_format: str = "csv",
+    reader: str = "pandas"
 ) -> None:
+    """
+    Processes GHCN-Daily yearly files into per-station daily weather.
+
+    Each year is written to its own output and checkpointed in a manifest
+    (output_dir/weather_manifest.json) with the input's size, mtime and
+    sha256, a hash of the element config and station list, and the output
+    path. Re-runs skip years whose output is current, so an interrupted
+    run resumes where it stopped and adding a year processes one file.
+    The combined output is built from the per-year outputs and only
+    rebuilt when a year changed or the file list differs.
+
+    With n_workers > 1 the files are dispatched to a process pool, one file
+    per task. The combined output is assembled in file_list order, so it is
+    identical to a sequential run. Callers using a pool must guard their
+    entry point with if __name__ == "__main__".
+
+    With chunksize set each file is streamed in chunks of that many rows
+    and folded into running (Station_ID, Date) aggregates, so memory is
+    bounded by the station-days kept rather than the raw file size.
+
+    With output_format="parquet" years are written straight to Parquet,
+    hive-partitioned as output_dir/Us_Weather_Parquet/Year=YYYY, sorted by
+    station with a string Station_ID (so row groups can be pruned by
+    station), a date32 Date and one schema for all years (see
+    weather_schema). The combined file is then Parquet too and
+    is written by appending each year's row groups, never holding more
+    than one row group in memory.
+
+    With reader="arrow" files are parsed by the multi-threaded pyarrow.csv
+    reader, reading only the four used columns and Station_ID/Element as
+    dictionaries, so the station and element filters test each distinct
+    value once instead of every row.
+
+    Args:
+        file_list: Yearly files (e.g. "2000.csv.gz") found in input_dir.
+        config_path: Element -> aggregation JSON (config/element_config.json).
+        stations_file: CSV listing the stations to keep.
+        station_fieldname: Column of stations_file holding the station IDs.
+        output_dir: Directory the outputs and manifest are written to.
+        combine_output: Also write one combined file of all years.
+        combined_filename: Name of the combined output (its extension
+            is replaced by .parquet in Parquet mode).
+        input_dir: Directory holding the yearly files.
+        n_workers: Number of worker processes (1 runs in this process).
+        max_worker_memory_mb: Optional address space limit per worker.
+        chunksize: Rows per chunk for streaming mode (None reads whole files).
+        force: Reprocess every file even if its output is current.
+        output_format: "csv" (zipped CSV per year) or "parquet".
+        reader: GHCN parser, "pandas" or "arrow".
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output_format: {output_format}. "
+                         f"Supported: {list(OUTPUT_FORMATS)}")
     element_agg_map = load_element_config(config_path)
-    element_list = list(element_agg_map.keys())
     station_df = pd.read_csv(stations_file)
-    station_ids = set(station_df[station_fieldname])
+    # Missing IDs (a site without a closest station) match no weather rows
+    station_ids = set(station_df[station_fieldname].dropna().astype(str))
 
-    combined_dfs = []
+    manifest = load_manifest(output_dir)
+    config_hash = _config_hash(element_agg_map, station_ids, output_format)
 
-    for file in tqdm(file_list, desc="Processing files"):
-        filepath = os.path.join("Not_to_be_shared_to_repo", file)
-        logging.info(f"Reading file: {filepath}")
+    signatures, pending = {}, []
+    for file in file_list:
+        entry = manifest["files"].get(file)
+        signatures[file] = _input_signature(os.path.join(input_dir, file), entry)
+        if not force and _is_current(entry, signatures[file], config_hash):
+            logging.info(f"Skipping {file}: output is current")
+            entry.update(signatures[file])  # Touched but unchanged: keep new mtime
+        else:
+            pending.append(file)
+    _save_manifest(manifest, output_dir)
+    logging.info(f"{len(pending)} of {len(file_list)} files to process")
 
-        weather_df = pd.read_csv(
-            filepath,
-            header=None,
-            usecols=[0, 1, 2, 3],
-            names=["Station_ID", "Date", "Element", "DataValue"]
-        )
+    task_args = {
+        file: (file, element_agg_map, station_ids, input_dir, output_dir, chunksize,
+               output_format, reader)
+        for file in pending
+    }
+    failed = {}
 
-        logging.info(f"Initial shape: {weather_df.shape}")
-        weather_df = weather_df[
-            (weather_df["Station_ID"].str[:2] == "US") &
-            (weather_df["Station_ID"].isin(station_ids)) &
-            (weather_df["Element"].isin(element_list)) &
-            (weather_df["DataValue"] != 9999)
-        ]
-        logging.info(f"Filtered shape: {weather_df.shape}")
-
-        weather_df["AggType"] = weather_df["Element"].map(element_agg_map)
-        pivoted_dfs = []
-
-        for agg_func in ["mean", "max", "min"]:
-            sub_df = weather_df[weather_df["AggType"] == agg_func]
-            if not sub_df.empty:
-                pivot = sub_df.pivot_table(
-                    index=["Station_ID", "Date"],
-                    columns="Element",
-                    values="DataValue",
-                    aggfunc=agg_func
-                )
-                pivoted_dfs.append(pivot)
-
-        final_df = pd.concat(pivoted_dfs, axis=1).reset_index()
-        logging.info(f"Final shape: {final_df.shape}")
+    if n_workers > 1 and len(pending) > 1:
+        logging.info(f"Processing {len(pending)} files with {n_workers} workers")
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_limit_worker_memory,
+            initargs=(max_worker_memory_mb,)
+        ) as executor:
+            futures = {
+                executor.submit(_process_and_save, *args): file
+                for file, args in task_args.items()
+            }
+            # Checkpoint each file as soon as it finishes
+            for future in tqdm(as_completed(futures), total=len(futures),
+                               desc="Processing files"):
+                file = futures[future]
+                try:
+                    output_path = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to process {file}: {e!r}")
+                    failed[file] = e
+                    continue
+                _record_output(manifest, file, signatures[file], config_hash,
+                               output_path, output_dir)
+    else:
+        for file, args in tqdm(task_args.items(), desc="Processing files"):
+            output_path = _process_and_save(*args)
+            _record_output(manifest, file, signatures[file], config_hash,
+                           output_path, output_dir)
 
-        if combine_output:
-            final_df["SourceFile"] = file  # Optional traceability
-            combined_dfs.append(final_df)
-        else:
-            output_file = f"Us_{file}_Weather_Unpacked.zip"
-            output_path = os.path.join(output_dir, output_file)
-            final_df.to_csv(output_path, index=False, compression="zip")
-            logging.info(f"Saved output to: {output_path}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} file(s) failed and will be retried "
+                           f"on the next run: {sorted(failed)}")
 
-    if combine_output and combined_dfs:
-        final_combined_df = pd.concat(combined_dfs, axis=0, ignore_index=True)
+    if combine_output:
+        if output_format == "parquet":
+            combined_filename = f"{os.path.splitext(combined_filename)[0]}.parquet"
         output_path = os.path.join(output_dir, combined_filename)
-        final_combined_df.to_csv(output_path, index=False, compression="zip")
-        logging.info(f"Saved combined output to: {output_path}")
+        combined_inputs = {file: signatures[file]["sha256"] for file in file_list}
+        previous = manifest.get("combined") or {}
+        if (pending or force
+                or previous.get("inputs") != combined_inputs
+                or previous.get("config_hash") != config_hash
+                or not os.path.exists(output_path)):
+            if output_format == "parquet":
+                _write_combined_parquet(file_list, manifest, output_path,
+                                        weather_schema(element_agg_map))
+            else:
+                _write_combined(file_list, manifest, output_path)
+            manifest["combined"] = {"output": output_path,
+                                    "inputs": combined_inputs,
+                                    "config_hash": config_hash}
+            _save_manifest(manifest, output_dir)
+        else:
+            logging.info(f"Combined output is current: {output_path}")